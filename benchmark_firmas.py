@@ -0,0 +1,71 @@
+import json
+import sys
+import time
+
+from blockchain import Wallet, Transaction, SIGNATURE_SCHEMES, verified_signatures
+
+# Cantidad de transacciones firmadas y verificadas por esquema
+N_TRANSACTIONS = 200
+
+def build_transactions(wallet, count):
+    """Crea transacciones sin firmar desde la wallet indicada"""
+    transactions = []
+    for i in range(count):
+        tx = Transaction(
+            wallet.get_address(),
+            f"destinatario_{i}",
+            1.0,
+            wallet.get_public_key_pem()
+        )
+        transactions.append(tx)
+    return transactions
+
+def benchmark_scheme(scheme, count):
+    """Mide generación de claves, firma, verificación y tamaño de transacción"""
+    start = time.perf_counter()
+    wallet = Wallet("benchmark", scheme)
+    keygen_seconds = time.perf_counter() - start
+
+    transactions = build_transactions(wallet, count)
+
+    start = time.perf_counter()
+    for tx in transactions:
+        tx.sign_transaction(wallet.sign_transaction(tx.to_dict()))
+    sign_seconds = time.perf_counter() - start
+
+    # Sin la caché de firmas para medir la verificación real
+    verified_signatures.clear()
+    start = time.perf_counter()
+    for tx in transactions:
+        if not tx.is_valid():
+            raise Exception(f"Firma inválida con el esquema {scheme}")
+    verify_seconds = time.perf_counter() - start
+
+    tx_bytes = len(json.dumps(transactions[0].to_signed_dict()).encode())
+
+    return {
+        'scheme': scheme,
+        'keygen_ms': keygen_seconds * 1000,
+        'sign_per_sec': count / sign_seconds,
+        'verify_per_sec': count / verify_seconds,
+        'signature_bytes': len(bytes.fromhex(transactions[0].signature)),
+        'public_key_bytes': len(wallet.get_public_key_pem().encode()),
+        'tx_bytes': tx_bytes
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else N_TRANSACTIONS
+
+    print(f"\n🔐 Benchmark de esquemas de firma ({count} transacciones por esquema)\n")
+    print(f"{'Esquema':<10}{'Keygen (ms)':>13}{'Firmas/s':>12}{'Verif./s':>12}"
+          f"{'Firma (B)':>11}{'Clave (B)':>11}{'TX (B)':>9}")
+    print("-" * 78)
+
+    for scheme in SIGNATURE_SCHEMES:
+        r = benchmark_scheme(scheme, count)
+        print(f"{r['scheme']:<10}{r['keygen_ms']:>13.1f}{r['sign_per_sec']:>12.0f}{r['verify_per_sec']:>12.0f}"
+              f"{r['signature_bytes']:>11}{r['public_key_bytes']:>11}{r['tx_bytes']:>9}")
+    print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import gzip
+import json
+import sys
+import time
+
+from blockchain import Wallet, Transaction, Block, encode_message, decode_message
+
+# Tamaño de la cadena de prueba
+N_BLOCKS = 50
+TX_PER_BLOCK = 20
+N_WALLETS = 5
+REPETITIONS = 10
+
+def build_chain(n_blocks, tx_per_block):
+    """Crea bloques de ejemplo (sin minar) con transacciones firmadas por unas pocas wallets"""
+    wallets = [Wallet(f"wallet_{i}") for i in range(N_WALLETS)]
+    chain = [Block(0, [], "0")]
+
+    for index in range(1, n_blocks + 1):
+        transactions = []
+        for i in range(tx_per_block):
+            sender = wallets[i % N_WALLETS]
+            recipient = wallets[(i + 1) % N_WALLETS]
+            tx = Transaction(sender.get_address(), recipient.get_address(), 1.5, sender.get_public_key_pem())
+            tx.sign_transaction(sender.sign_transaction(tx.to_dict()))
+            transactions.append(tx)
+        transactions.append(Transaction("MINING_REWARD", wallets[0].get_address(), 10, "SYSTEM"))
+        chain.append(Block(index, transactions, chain[-1].hash))
+
+    return [block.to_dict() for block in chain]
+
+def measure(function, *args):
+    """Mejor tiempo de una llamada en milisegundos"""
+    best = None
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else N_BLOCKS
+    tx_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else TX_PER_BLOCK
+
+    print(f"\n📦 Benchmark de formato de exportación ({n_blocks} bloques x {tx_per_block} transacciones)\n")
+    chain_data = build_chain(n_blocks, tx_per_block)
+    meta = {'length': len(chain_data), 'from': 0, 'valid': True}
+
+    encode_json = lambda: json.dumps(dict(meta, chain=chain_data)).encode()
+    encode_wire = lambda: encode_message(meta, blocks=chain_data)
+    json_size = len(encode_json())
+
+    # Por la red ambos viajan con gzip (nivel 5, como /blockchain/export): esa es la comparación que importa
+    results = [
+        ('JSON', encode_json, lambda data: json.loads(data)),
+        ('JSON + gzip', lambda: gzip.compress(encode_json(), compresslevel=5),
+         lambda data: json.loads(gzip.decompress(data))),
+        ('Binario', encode_wire, lambda data: decode_message(data)),
+        ('Binario + gzip', lambda: gzip.compress(encode_wire(), compresslevel=5),
+         lambda data: decode_message(gzip.decompress(data))),
+    ]
+
+    print(f"{'Formato':<16}{'Bytes':>12}{'% de JSON':>12}{'Codificar (ms)':>17}{'Decodificar (ms)':>19}")
+    print("-" * 76)
+    for name, encode, decode in results:
+        payload = encode()
+        print(f"{name:<16}{len(payload):>12}{len(payload) * 100 / json_size:>11.1f}%"
+              f"{measure(encode):>17.2f}{measure(decode, payload):>19.2f}")
+    print()
+
+if __name__ == '__main__':
+    main()
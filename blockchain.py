@@ -1,24 +1,192 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.backends import default_backend
 import hashlib
+import heapq
+import io
 import json
+import math
+import mmap
+import os
+import random
+import struct
 import time
+import zlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 import requests
 
-# ==================== WALLET ====================
-class Wallet:
-    """Billetera digital con par de claves RSA"""
-    def __init__(self, owner_name):
-        self.owner_name = owner_name
-        self.private_key = rsa.generate_private_key(
+# ==================== CACHÉS ====================
+class LRUCache:
+    """Caché acotada que descarta la entrada usada hace más tiempo"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        """Tamaño y contadores de aciertos/fallos"""
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# Firmas ya verificadas, por (txid, firma)
+SIGNATURE_CACHE_SIZE = int(os.environ.get('SIGNATURE_CACHE_SIZE', 10000))
+verified_signatures = LRUCache(SIGNATURE_CACHE_SIZE)
+
+# Claves públicas ya parseadas, por hash del PEM
+PUBLIC_KEY_CACHE_SIZE = int(os.environ.get('PUBLIC_KEY_CACHE_SIZE', 256))
+public_key_cache = LRUCache(PUBLIC_KEY_CACHE_SIZE)
+
+def load_public_key(public_key_pem):
+    """Carga una clave pública PEM reutilizando las que ya fueron parseadas"""
+    key_id = hashlib.sha256(public_key_pem.encode()).hexdigest()
+    public_key = public_key_cache.get(key_id)
+    if public_key is None:
+        public_key = serialization.load_pem_public_key(
+            public_key_pem.encode(),
+            backend=default_backend()
+        )
+        public_key_cache.put(key_id, public_key)
+    return public_key
+
+# ==================== ESQUEMAS DE FIRMA ====================
+class RSASignatureScheme:
+    """RSA-2048 con padding PSS (esquema original)"""
+    name = 'rsa'
+    
+    def generate_private_key(self):
+        return rsa.generate_private_key(
             public_exponent=65537,
             key_size=2048,
             backend=default_backend()
         )
+    
+    def sign(self, private_key, message):
+        return private_key.sign(
+            message,
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH
+            ),
+            hashes.SHA256()
+        )
+    
+    def verify(self, public_key, signature, message):
+        public_key.verify(
+            signature,
+            message,
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH
+            ),
+            hashes.SHA256()
+        )
+    
+    def handles(self, public_key):
+        return isinstance(public_key, rsa.RSAPublicKey)
+
+class Ed25519SignatureScheme:
+    """Ed25519: claves y firmas pequeñas, firma y verificación rápidas"""
+    name = 'ed25519'
+    
+    def generate_private_key(self):
+        return ed25519.Ed25519PrivateKey.generate()
+    
+    def sign(self, private_key, message):
+        return private_key.sign(message)
+    
+    def verify(self, public_key, signature, message):
+        public_key.verify(signature, message)
+    
+    def handles(self, public_key):
+        return isinstance(public_key, ed25519.Ed25519PublicKey)
+
+# Orden del grupo de la curva P-256
+P256_ORDER = 0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551
+
+class ECDSASignatureScheme:
+    """ECDSA sobre la curva P-256 con SHA-256 (firmas en forma canónica, con S bajo)"""
+    name = 'ecdsa'
+    
+    def generate_private_key(self):
+        return ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+    
+    def sign(self, private_key, message):
+        r, s = decode_dss_signature(private_key.sign(message, ec.ECDSA(hashes.SHA256())))
+        # (r, s) y (r, n - s) son ambas válidas: se emite siempre la de S bajo
+        if s > P256_ORDER // 2:
+            s = P256_ORDER - s
+        return encode_dss_signature(r, s)
+    
+    def verify(self, public_key, signature, message):
+        # Sin esta regla un tercero podría cambiar s por n - s y obtener otro txid para el mismo pago
+        r, s = decode_dss_signature(signature)
+        if s > P256_ORDER // 2 or encode_dss_signature(r, s) != signature:
+            raise ValueError("Firma ECDSA no canónica")
+        public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+    
+    def handles(self, public_key):
+        return isinstance(public_key, ec.EllipticCurvePublicKey)
+
+SIGNATURE_SCHEMES = {
+    scheme.name: scheme
+    for scheme in (RSASignatureScheme(), Ed25519SignatureScheme(), ECDSASignatureScheme())
+}
+DEFAULT_SIGNATURE_SCHEME = 'rsa'
+
+def get_signature_scheme(public_key):
+    """Obtiene el esquema de firma que corresponde al tipo de la clave pública"""
+    for scheme in SIGNATURE_SCHEMES.values():
+        if scheme.handles(public_key):
+            return scheme
+    raise Exception(f"Tipo de clave no soportado: {type(public_key).__name__}")
+
+# ==================== WALLET ====================
+class Wallet:
+    """Billetera digital con un par de claves del esquema de firma elegido"""
+    def __init__(self, owner_name, scheme=DEFAULT_SIGNATURE_SCHEME):
+        if scheme not in SIGNATURE_SCHEMES:
+            raise Exception(f"Esquema de firma no soportado: {scheme}")
+        
+        self.owner_name = owner_name
+        self.scheme = SIGNATURE_SCHEMES[scheme]
+        self.private_key = self.scheme.generate_private_key()
         self.public_key = self.private_key.public_key()
         
     def get_address(self):
@@ -32,14 +200,7 @@ class Wallet:
     def sign_transaction(self, transaction_data):
         """Firma una transacción con la clave privada"""
         message = json.dumps(transaction_data, sort_keys=True).encode()
-        signature = self.private_key.sign(
-            message,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
+        signature = self.scheme.sign(self.private_key, message)
         return signature.hex()
     
     def get_public_key_pem(self):
@@ -50,24 +211,78 @@ class Wallet:
         ).decode()
 
 # ==================== TRANSACTION ====================
+def is_finite_number(value):
+    """True si value es un int o un float finito (los bool no cuentan)"""
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, float) and math.isfinite(value))
+
 class Transaction:
     """Transacción entre dos wallets"""
-    def __init__(self, sender_address, recipient_address, amount, sender_public_key):
+    def __init__(self, sender_address, recipient_address, amount, sender_public_key, fee=0):
         self.sender_address = sender_address
         self.recipient_address = recipient_address
         self.amount = amount
+        # Comisión opcional para el minero que incluya la transacción
+        self.fee = fee
         self.timestamp = time.time()
         self.sender_public_key = sender_public_key
         self.signature = None
         
     def to_dict(self):
-        return {
+        data = {
             'sender_address': self.sender_address,
             'recipient_address': self.recipient_address,
             'amount': self.amount,
             'timestamp': self.timestamp,
             'sender_public_key': self.sender_public_key
         }
+        # Sin comisión el formato queda igual que antes (mismas firmas y txid)
+        if self.fee:
+            data['fee'] = self.fee
+        return data
+    
+    def to_signed_dict(self):
+        """Datos de la transacción junto con su firma (formato de exportación)"""
+        data = self.to_dict()
+        data['signature'] = self.signature
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Reconstruye una transacción desde su formato de exportación"""
+        tx = cls(
+            data['sender_address'],
+            data['recipient_address'],
+            data['amount'],
+            data['sender_public_key'],
+            data.get('fee', 0)
+        )
+        tx.timestamp = data['timestamp']
+        if data.get('signature'):
+            tx.sign_transaction(data['signature'])
+        return tx
+    
+    def total_cost(self):
+        """Lo que se descuenta al remitente: monto más comisión"""
+        return self.amount + self.fee
+    
+    def check_amounts(self):
+        """Revisa que el monto sea un número positivo y la comisión uno no negativo; retorna el error o None"""
+        if not is_finite_number(self.amount) or self.amount <= 0:
+            return "Monto inválido"
+        if not is_finite_number(self.fee) or self.fee < 0:
+            return "Comisión inválida"
+        return None
+    
+    def size(self):
+        """Bytes de la transacción en formato de exportación"""
+        return len(json.dumps(self.to_signed_dict()).encode())
+    
+    def calculate_hash(self):
+        """Identificador de la transacción: hash de los datos firmados y la firma"""
+        tx_string = json.dumps(self.to_signed_dict(), sort_keys=True)
+        return hashlib.sha256(tx_string.encode()).hexdigest()
     
     def sign_transaction(self, signature):
         self.signature = signature
@@ -79,152 +294,2219 @@ class Transaction:
             
         if not self.signature:
             return False
+        
+        # Solo hex en minúsculas: bytes.fromhex también acepta mayúsculas y espacios,
+        # y esas variantes de la misma firma tendrían otro txid
+        try:
+            if bytes.fromhex(self.signature).hex() != self.signature:
+                return False
+        except (TypeError, ValueError):
+            return False
+        
+        # Si esta misma transacción y firma ya se verificaron, no repetir RSA
+        cache_key = (self.calculate_hash(), self.signature)
+        if verified_signatures.get(cache_key):
+            return True
             
         try:
-            public_key = serialization.load_pem_public_key(
-                self.sender_public_key.encode(),
-                backend=default_backend()
-            )
+            public_key = load_public_key(self.sender_public_key)
+            scheme = get_signature_scheme(public_key)
             
             message = json.dumps(self.to_dict(), sort_keys=True).encode()
-            public_key.verify(
-                bytes.fromhex(self.signature),
-                message,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
+            scheme.verify(public_key, bytes.fromhex(self.signature), message)
+            verified_signatures.put(cache_key, True)
             return True
         except Exception as e:
             print(f"Error verificando firma: {e}")
             return False
 
+# ==================== VERIFICACIÓN EN LOTE ====================
+# Transacciones que verifica cada tarea del pool
+VERIFY_CHUNK_SIZE = 64
+# Con menos firmas por verificar no compensa el costo de enviar trabajo al pool
+VERIFY_PARALLEL_THRESHOLD = 128
+
+_verify_pool = None
+_verify_pool_workers = 0
+
+def _verify_chunk(start, tx_payloads):
+    """Verifica un tramo de transacciones y retorna el índice de la primera inválida (o None)"""
+    for offset, tx_data in enumerate(tx_payloads):
+        if not Transaction.from_dict(tx_data).is_valid():
+            return start + offset
+    return None
+
+def get_verify_pool(workers):
+    """Obtiene (o crea) el pool de procesos para verificar firmas"""
+    global _verify_pool, _verify_pool_workers
+    
+    if _verify_pool is None or _verify_pool_workers != workers:
+        if _verify_pool is not None:
+            _verify_pool.shutdown(cancel_futures=True)
+        _verify_pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_process_context())
+        _verify_pool_workers = workers
+    
+    return _verify_pool
+
+def verify_transactions_batch(transactions, workers=None):
+    """Verifica las firmas de una lista de transacciones repartiéndolas en un pool de procesos
+    
+    Retorna (índice, transacción) de la primera transacción inválida, o None si todas son válidas.
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    # Las recompensas y las firmas ya cacheadas no necesitan ir al pool
+    to_verify = []
+    for i, tx in enumerate(transactions):
+        if tx.sender_address == "MINING_REWARD":
+            continue
+        if tx.signature and verified_signatures.get((tx.calculate_hash(), tx.signature)):
+            continue
+        to_verify.append(i)
+    
+    if len(to_verify) < VERIFY_PARALLEL_THRESHOLD or workers == 1:
+        for i in to_verify:
+            if not transactions[i].is_valid():
+                return i, transactions[i]
+        return None
+    
+    pool = get_verify_pool(workers)
+    futures = []
+    for chunk_start in range(0, len(to_verify), VERIFY_CHUNK_SIZE):
+        chunk = to_verify[chunk_start:chunk_start + VERIFY_CHUNK_SIZE]
+        payloads = [transactions[i].to_signed_dict() for i in chunk]
+        futures.append((chunk, pool.submit(_verify_chunk, 0, payloads)))
+    
+    first_invalid = None
+    for chunk, future in futures:
+        failed_offset = future.result()
+        if failed_offset is not None:
+            first_invalid = chunk[failed_offset]
+            # Los tramos siguientes ya no pueden dar un índice menor
+            for _, pending in futures:
+                pending.cancel()
+            break
+        # Registrar en la caché local lo que verificaron los otros procesos
+        for i in chunk:
+            tx = transactions[i]
+            verified_signatures.put((tx.calculate_hash(), tx.signature), True)
+    
+    if first_invalid is None:
+        return None
+    return first_invalid, transactions[first_invalid]
+
+# ==================== MERKLE ====================
+# Raíz de un bloque sin transacciones
+EMPTY_MERKLE_ROOT = '0' * 64
+
+def merkle_parent(left, right):
+    """Hash de un nodo interno del árbol de Merkle"""
+    return hashlib.sha256((left + right).encode()).hexdigest()
+
+def build_merkle_tree(tx_hashes):
+    """Construye el árbol de Merkle como lista de niveles (hojas primero, raíz al final)"""
+    if not tx_hashes:
+        return [[EMPTY_MERKLE_ROOT]]
+    
+    levels = [list(tx_hashes)]
+    while len(levels[-1]) > 1:
+        level = list(levels[-1])
+        # Con cantidad impar se duplica el último hash (como en Bitcoin)
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        levels.append([merkle_parent(level[i], level[i + 1]) for i in range(0, len(level), 2)])
+    
+    return levels
+
+def merkle_root(tx_hashes):
+    """Calcula la raíz de Merkle de una lista de hashes de transacciones"""
+    return build_merkle_tree(tx_hashes)[-1][0]
+
+def merkle_proof(tree, position):
+    """Rama de Merkle (hashes hermanos hasta la raíz) para la hoja en position"""
+    branch = []
+    for level in tree[:-1]:
+        sibling = position ^ 1
+        # El último nodo de un nivel impar es hermano de sí mismo
+        sibling_hash = level[sibling] if sibling < len(level) else level[position]
+        branch.append({
+            'hash': sibling_hash,
+            'side': 'left' if sibling < position else 'right'
+        })
+        position //= 2
+    return branch
+
+def verify_merkle_proof(tx_hash, branch, root):
+    """Verifica que tx_hash pertenece al árbol con la raíz dada usando la rama"""
+    current = tx_hash
+    for step in branch:
+        if step['side'] == 'left':
+            current = merkle_parent(step['hash'], current)
+        else:
+            current = merkle_parent(current, step['hash'])
+    return current == root
+
+# ==================== DIFICULTAD ====================
+# Cada cuántos bloques se recalcula el objetivo de Proof of Work
+RETARGET_INTERVAL = max(2, int(os.environ.get('RETARGET_INTERVAL', 10)))
+# Tiempo deseado entre bloques (segundos)
+TARGET_BLOCK_SECONDS = float(os.environ.get('TARGET_BLOCK_SECONDS', 10))
+# Máximo factor de cambio del objetivo en un solo ajuste
+MAX_RETARGET_FACTOR = 4
+
+def difficulty_to_target(difficulty):
+    """Objetivo numérico equivalente a exigir `difficulty` ceros hexadecimales al inicio del hash"""
+    return 2 ** (256 - 4 * difficulty) - 1
+
+def target_to_difficulty(target):
+    """Dificultad expresada en ceros hexadecimales (con decimales) de un objetivo"""
+    return round((256 - math.log2(target + 1)) / 4, 4)
+
+def hash_meets_target(block_hash, target):
+    """Un hash es válido si, leído como número, no supera el objetivo"""
+    return int(block_hash, 16) <= target
+
+def target_work(target):
+    """Trabajo esperado (hashes) para encontrar un bloque con el objetivo dado"""
+    return 2 ** 256 // (target + 1)
+
+def retarget(target, first_timestamp, last_timestamp, max_target):
+    """Ajusta el objetivo según lo que tardaron los últimos RETARGET_INTERVAL bloques"""
+    expected = (RETARGET_INTERVAL - 1) * TARGET_BLOCK_SECONDS
+    actual = last_timestamp - first_timestamp
+    # El cambio se limita para que unos pocos timestamps extremos no disparen la dificultad
+    actual = min(max(actual, expected / MAX_RETARGET_FACTOR), expected * MAX_RETARGET_FACTOR)
+    new_target = target * round(actual * 1000) // max(1, round(expected * 1000))
+    return max(1, min(new_target, max_target))
+
+# ==================== MINERÍA PARALELA ====================
+# Nonces que prueba cada worker antes de revisar si otro ya encontró solución
+MINING_CHUNK_SIZE = 2000
+
+_mining_pool = None
+_mining_pool_workers = 0
+_mining_stop_event = None
+
+def _init_mining_worker(stop_event):
+    """Inicializa un proceso minero con el evento de parada compartido"""
+    global _mining_stop_event
+    _mining_stop_event = stop_event
+
+def _mine_nonce_range(header_prefix, target, start, step):
+    """Prueba los nonces start, start+step, ... hasta encontrar uno válido o recibir la señal de parada"""
+    # Comparar el digest en bytes (big-endian) equivale a comparar el hash como número
+    target_bytes = target.to_bytes(32, 'big')
+    base = hashlib.sha256(header_prefix)
+    nonce = start
+    attempts = 0
+    
+    while not _mining_stop_event.is_set():
+        for _ in range(MINING_CHUNK_SIZE):
+            digest = base.copy()
+            digest.update(str(nonce).encode())
+            attempts += 1
+            if digest.digest() <= target_bytes:
+                _mining_stop_event.set()
+                return nonce, digest.hexdigest(), attempts
+            nonce += step
+    
+    return None, None, attempts
+
+def get_process_context():
+    """Contexto para los pools de procesos: forkserver si existe (en Windows solo hay spawn)"""
+    # Con fork, el hijo copia este proceso con sus hilos a medias y puede quedar con un lock tomado
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+def get_mining_pool(workers):
+    """Obtiene (o crea) el pool de procesos mineros con la cantidad de workers indicada"""
+    global _mining_pool, _mining_pool_workers, _mining_stop_event
+    
+    if _mining_pool is None or _mining_pool_workers != workers:
+        if _mining_pool is not None:
+            _mining_pool.shutdown(cancel_futures=True)
+        context = get_process_context()
+        _mining_stop_event = context.Event()
+        _mining_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_mining_worker,
+            initargs=(_mining_stop_event,)
+        )
+        _mining_pool_workers = workers
+    
+    return _mining_pool
+
+def mine_parallel(header_prefix, target, workers, should_stop=None):
+    """Reparte el espacio de nonces entre varios procesos y retorna el primer ganador"""
+    pool = get_mining_pool(workers)
+    _mining_stop_event.clear()
+    
+    # Cada worker recorre los nonces congruentes con su número módulo workers
+    futures = [
+        pool.submit(_mine_nonce_range, header_prefix, target, start, workers)
+        for start in range(workers)
+    ]
+    
+    done = set()
+    while not done:
+        done, _ = wait(futures, timeout=0.1, return_when=FIRST_COMPLETED)
+        if should_stop is not None and should_stop():
+            break
+    _mining_stop_event.set()
+    # Esperar a que los demás workers se detengan para no contaminar el siguiente minado
+    wait(futures)
+    
+    nonce, block_hash, attempts = None, None, 0
+    for future in futures:
+        result_nonce, result_hash, result_attempts = future.result()
+        attempts += result_attempts
+        if result_hash and (future in done or block_hash is None):
+            nonce, block_hash = result_nonce, result_hash
+    
+    return nonce, block_hash, attempts
+
 # ==================== BLOCK ====================
+def serialize_header_prefix(header):
+    """Cabecera serializada sin el nonce (constante durante el minado)"""
+    return json.dumps({
+        'index': header['index'],
+        'timestamp': header['timestamp'],
+        'previous_hash': header['previous_hash'],
+        'merkle_root': header['merkle_root']
+    }, sort_keys=True).encode()
+
+def calculate_header_hash(header):
+    """Hash de una cabecera de bloque (sin necesitar sus transacciones)"""
+    return hashlib.sha256(serialize_header_prefix(header) + str(header['nonce']).encode()).hexdigest()
+
 class Block:
     """Bloque de la blockchain"""
-    def __init__(self, index, transactions, previous_hash, nonce=0):
+    def __init__(self, index, transactions, previous_hash, nonce=0, timestamp=None):
         self.index = index
-        self.timestamp = time.time()
+        self.timestamp = timestamp if timestamp is not None else time.time()
         self.transactions = transactions
         self.previous_hash = previous_hash
+        self.merkle_tree = None
+        self.merkle_root = self.calculate_merkle_root()
         self.nonce = nonce
         self.hash = self.calculate_hash()
-        
-    def calculate_hash(self):
-        """Calcula el hash del bloque"""
-        block_string = json.dumps({
+        self.mining_stats = None
+        # Resúmenes para la API (se calculan una sola vez)
+        self.summary = None
+        self.full_summary = None
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Reconstruye un bloque desde su formato de exportación"""
+        transactions = [Transaction.from_dict(tx_data) for tx_data in data.get('transactions', [])]
+        block = cls(
+            data['index'],
+            transactions,
+            data['previous_hash'],
+            data.get('nonce', 0),
+            data['timestamp']
+        )
+        # Se conservan la raíz y el hash recibidos para poder validarlos
+        block.merkle_root = data.get('merkle_root', block.merkle_root)
+        block.hash = data['hash']
+        return block
+    
+    def to_dict(self):
+        """Formato de exportación: cabecera, hash y transacciones firmadas"""
+        data = self.get_header()
+        data['hash'] = self.hash
+        data['transactions'] = []
+        for tx, txid in zip(self.transactions, self.get_txids()):
+            tx_data = tx.to_signed_dict()
+            tx_data['txid'] = txid
+            data['transactions'].append(tx_data)
+        return data
+    
+    def calculate_merkle_root(self):
+        """Construye el árbol de Merkle de las transacciones y retorna su raíz"""
+        self.merkle_tree = build_merkle_tree([tx.calculate_hash() for tx in self.transactions])
+        return self.merkle_tree[-1][0]
+    
+    def get_summary(self):
+        """Resumen del bloque para GET /blockchain (se calcula una vez y se reutiliza)"""
+        if self.summary is None:
+            self.summary = {
+                'index': self.index,
+                'timestamp': datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                'transactions': len(self.get_txids()),
+                'hash': self.hash,
+                'previous_hash': self.previous_hash,
+                'nonce': self.nonce
+            }
+        return self.summary
+    
+    def get_full_summary(self):
+        """Bloque con sus transacciones para GET /blockchain/full (se calcula una vez)"""
+        if self.full_summary is None:
+            transactions = []
+            for tx, txid in zip(self.transactions, self.get_txids()):
+                transactions.append({
+                    'txid': txid,
+                    'sender': tx.sender_address,
+                    'recipient': tx.recipient_address,
+                    'amount': tx.amount,
+                    'fee': tx.fee,
+                    'timestamp': datetime.fromtimestamp(tx.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+                })
+            
+            self.full_summary = {
+                'index': self.index,
+                'timestamp': datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                'transactions': transactions,
+                'hash': self.hash,
+                'previous_hash': self.previous_hash
+            }
+        return self.full_summary
+    
+    def get_txids(self):
+        """Identificadores de las transacciones del bloque (hojas del árbol de Merkle)"""
+        return self.merkle_tree[0] if self.transactions else []
+    
+    def get_merkle_proof(self, position):
+        """Rama de Merkle de la transacción en la posición dada"""
+        return merkle_proof(self.merkle_tree, position)
+    
+    def get_header(self):
+        """Cabecera del bloque: lo único que cubre el Proof of Work"""
+        return {
             'index': self.index,
             'timestamp': self.timestamp,
-            'transactions': [tx.to_dict() for tx in self.transactions],
             'previous_hash': self.previous_hash,
+            'merkle_root': self.merkle_root,
             'nonce': self.nonce
-        }, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
-    
-    def mine_block(self, difficulty):
-        """Minado del bloque (Proof of Work)"""
-        target = '0' * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+        }
+    
+    def header_prefix(self):
+        """Cabecera serializada sin el nonce (constante durante el minado)"""
+        return serialize_header_prefix(self.get_header())
+        
+    def calculate_hash(self):
+        """Calcula el hash del bloque a partir de su cabecera"""
+        return hashlib.sha256(self.header_prefix() + str(self.nonce).encode()).hexdigest()
+    
+    def mine_block(self, target, workers=1, should_stop=None):
+        """Minado del bloque (Proof of Work) hasta que su hash no supere target, opcionalmente en varios procesos
+        
+        should_stop se consulta periódicamente; si retorna True el minado se abandona y se retorna None.
+        """
+        start_time = time.time()
+        
+        if workers > 1:
+            nonce, block_hash, attempts = mine_parallel(self.header_prefix(), target, workers, should_stop)
+            if block_hash is None:
+                print(f"⏹️  Minado interrumpido tras {attempts} hashes")
+                return None
+            self.nonce, self.hash = nonce, block_hash
+        else:
+            # El prefijo de la cabecera se hashea una sola vez y se reutiliza su estado
+            target_bytes = target.to_bytes(32, 'big')
+            base = hashlib.sha256(self.header_prefix())
+            attempts = 1
+            found = hash_meets_target(self.hash, target)
+            while not found:
+                if should_stop is not None and attempts % MINING_CHUNK_SIZE == 0 and should_stop():
+                    print(f"⏹️  Minado interrumpido tras {attempts} hashes")
+                    return None
+                self.nonce += 1
+                digest = base.copy()
+                digest.update(str(self.nonce).encode())
+                found = digest.digest() <= target_bytes
+                attempts += 1
+                if found:
+                    self.hash = digest.hexdigest()
+        
+        elapsed = time.time() - start_time
+        self.mining_stats = {
+            'workers': workers,
+            'difficulty': target_to_difficulty(target),
+            'hashes': attempts,
+            'seconds': round(elapsed, 4),
+            'hash_rate': round(attempts / elapsed, 2) if elapsed > 0 else attempts
+        }
         print(f"✅ Bloque minado: {self.hash}")
+        print(f"⚡ {attempts} hashes en {elapsed:.2f}s ({self.mining_stats['hash_rate']} H/s, {workers} workers)")
+        return self.mining_stats
+
+# ==================== ALMACENAMIENTO ====================
+# Cada cuántos bloques se guarda una instantánea de balances
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 100))
+SNAPSHOTS_TO_KEEP = 2
+
+class StoredBlock(Block):
+    """Bloque cargado desde disco: las transacciones se leen recién al primer acceso"""
+    def __init__(self, store, height, header):
+        self.store = store
+        self.height = height
+        self.index = header['index']
+        self.timestamp = header['timestamp']
+        self.previous_hash = header['previous_hash']
+        self.merkle_root = header['merkle_root']
+        self.nonce = header['nonce']
+        self.hash = header['hash']
+        self.txids = header['txids']
+        self.merkle_tree = None
+        self.mining_stats = None
+        self.summary = None
+        self.full_summary = None
+        self._transactions = None
+    
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            self._transactions = [
+                Transaction.from_dict(tx_data) for tx_data in self.store.read_transactions(self.height)
+            ]
+        return self._transactions
+    
+    def get_txids(self):
+        return self.txids
+    
+    def get_merkle_proof(self, position):
+        if self.merkle_tree is None:
+            self.merkle_tree = build_merkle_tree(self.txids)
+        return merkle_proof(self.merkle_tree, position)
+
+class BlockStore:
+    """Registro de bloques en disco de solo-anexar, con índice de offsets
+    
+    blocks.dat guarda por cada bloque su cabecera (JSON con los txid) seguida de sus
+    transacciones (JSON). blocks.idx guarda por cada bloque (offset, largo cabecera,
+    largo transacciones) con tamaño fijo, así se llega a cualquier bloque sin recorrer
+    el archivo de datos, que se lee mediante mmap.
+    """
+    INDEX_ENTRY = struct.Struct('>QII')
+    
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.data_path = os.path.join(directory, 'blocks.dat')
+        self.index_path = os.path.join(directory, 'blocks.idx')
+        self.lock = threading.RLock()
+        self.mmap = None
+        self.read_file = None
+        
+        self.entries = self._load_index()
+        self.data_file = open(self.data_path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+    
+    def _load_index(self):
+        """Lee el índice y descarta lo que haya quedado a medio escribir"""
+        entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % self.INDEX_ENTRY.size
+            entries = [entry for entry in self.INDEX_ENTRY.iter_unpack(raw[:usable])]
+        
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        while entries and sum(entries[-1]) > data_size:
+            entries.pop()
+        
+        # Dejar ambos archivos exactamente hasta el último bloque completo
+        data_end = sum(entries[-1]) if entries else 0
+        with open(self.data_path, 'ab') as f:
+            f.truncate(data_end)
+        with open(self.index_path, 'ab') as f:
+            f.truncate(len(entries) * self.INDEX_ENTRY.size)
+        return entries
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def _close_mmap(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.read_file.close()
+            self.mmap = None
+            self.read_file = None
+    
+    def _read(self, offset, length):
+        """Lee bytes del archivo de datos mediante mmap (se re-mapea si creció)"""
+        if self.mmap is None or offset + length > len(self.mmap):
+            self._close_mmap()
+            self.read_file = open(self.data_path, 'rb')
+            self.mmap = mmap.mmap(self.read_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mmap[offset:offset + length]
+    
+    def append(self, block):
+        """Agrega un bloque al final del registro"""
+        header = block.get_header()
+        header['hash'] = block.hash
+        header['txids'] = block.get_txids()
+        header_bytes = json.dumps(header).encode()
+        body_bytes = json.dumps([tx.to_signed_dict() for tx in block.transactions]).encode()
+        
+        with self.lock:
+            offset = sum(self.entries[-1]) if self.entries else 0
+            # Primero los datos y luego el índice: un corte a mitad deja el bloque sin indexar
+            self.data_file.write(header_bytes + body_bytes)
+            self.data_file.flush()
+            entry = (offset, len(header_bytes), len(body_bytes))
+            self.index_file.write(self.INDEX_ENTRY.pack(*entry))
+            self.index_file.flush()
+            self.entries.append(entry)
+    
+    def read_header(self, height):
+        with self.lock:
+            offset, header_length, _ = self.entries[height]
+            return json.loads(self._read(offset, header_length))
+    
+    def read_transactions(self, height):
+        with self.lock:
+            offset, header_length, body_length = self.entries[height]
+            return json.loads(self._read(offset + header_length, body_length))
+    
+    def load_blocks(self):
+        """Carga todos los bloques leyendo solo sus cabeceras"""
+        return [StoredBlock(self, height, self.read_header(height)) for height in range(len(self.entries))]
+    
+    def truncate(self, height):
+        """Descarta los bloques desde la altura indicada en adelante"""
+        with self.lock:
+            self._close_mmap()
+            self.entries = self.entries[:height]
+            data_end = sum(self.entries[-1]) if self.entries else 0
+            self.data_file.truncate(data_end)
+            self.index_file.truncate(len(self.entries) * self.INDEX_ENTRY.size)
+            # Las instantáneas de alturas descartadas ya no corresponden a la cadena
+            for snapshot_height in self.snapshot_heights():
+                if snapshot_height > height:
+                    os.remove(self._snapshot_path(snapshot_height))
+    
+    def _snapshot_path(self, height):
+        return os.path.join(self.directory, f'snapshot_{height}.json')
+    
+    def snapshot_heights(self):
+        """Alturas de las instantáneas guardadas, de menor a mayor"""
+        heights = []
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot_') and name.endswith('.json'):
+                heights.append(int(name[len('snapshot_'):-len('.json')]))
+        return sorted(heights)
+    
+    def save_snapshot(self, snapshot, keep=SNAPSHOTS_TO_KEEP):
+        """Guarda una instantánea de estado y borra las más antiguas"""
+        path = self._snapshot_path(snapshot['height'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+        
+        for height in self.snapshot_heights()[:-keep]:
+            os.remove(self._snapshot_path(height))
+    
+    def load_latest_snapshot(self):
+        """Carga la instantánea más reciente (None si no hay)"""
+        heights = self.snapshot_heights()
+        if not heights:
+            return None
+        with open(self._snapshot_path(heights[-1])) as f:
+            return json.load(f)
+    
+    def reset(self, chain):
+        """Reescribe el registro con una cadena completa"""
+        with self.lock:
+            self.truncate(0)
+            for block in chain:
+                self.append(block)
+    
+    def close(self):
+        with self.lock:
+            self._close_mmap()
+            self.data_file.close()
+            self.index_file.close()
+
+# ==================== FORMATO BINARIO ====================
+# Formato compacto para exportar la cadena y propagar bloques/transacciones.
+# Mensaje: MAGIC | metadatos JSON | registros (bloque o transacción) | fin.
+# Los hashes, direcciones y firmas en hexadecimal viajan como bytes, y cada
+# clave pública PEM se envía una sola vez por mensaje: las siguientes
+# transacciones la referencian por su posición en la tabla del mensaje.
+WIRE_MIMETYPE = 'application/x-blockchain-bin'
+WIRE_MAGIC = b'BCW2'
+
+RECORD_END = 0
+RECORD_BLOCK = 1
+RECORD_TRANSACTION = 2
+
+NEW_KEY = 0xFFFFFFFF
+NO_SIGNATURE = 0xFFFF
+# Flags de una transacción
+TX_HAS_FEE = 0x01
+
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+_TEXT_HEADER = struct.Struct('>cH')
+
+def _is_hex(text):
+    """Hexadecimal en minúsculas y de largo par (se puede enviar como bytes sin perder nada)"""
+    if len(text) % 2 == 1:
+        return False
+    try:
+        return bytes.fromhex(text).hex() == text
+    except ValueError:
+        return False
+
+class WireEncoder:
+    """Codifica registros del formato binario manteniendo la tabla de claves del mensaje"""
+    def __init__(self):
+        self.key_table = {}
+    
+    def start(self, meta):
+        """Inicio del mensaje: MAGIC y metadatos"""
+        meta_bytes = json.dumps(meta).encode()
+        return WIRE_MAGIC + _U32.pack(len(meta_bytes)) + meta_bytes
+    
+    def end(self):
+        return _U8.pack(RECORD_END)
+    
+    def _text(self, parts, text):
+        if _is_hex(text):
+            raw = bytes.fromhex(text)
+            parts.append(b'h' + _U16.pack(len(raw)) + raw)
+        else:
+            raw = text.encode()
+            parts.append(b's' + _U16.pack(len(raw)) + raw)
+    
+    def _number(self, parts, value):
+        if isinstance(value, int):
+            parts.append(b'i' + _I64.pack(value))
+        else:
+            parts.append(b'f' + _F64.pack(value))
+    
+    def _transaction(self, parts, tx_data):
+        self._text(parts, tx_data['sender_address'])
+        self._text(parts, tx_data['recipient_address'])
+        self._number(parts, tx_data['amount'])
+        self._number(parts, tx_data['timestamp'])
+        
+        key = tx_data['sender_public_key']
+        if key in self.key_table:
+            parts.append(_U32.pack(self.key_table[key]))
+        else:
+            self.key_table[key] = len(self.key_table)
+            raw = key.encode()
+            parts.append(_U32.pack(NEW_KEY) + _U32.pack(len(raw)) + raw)
+        
+        signature = tx_data.get('signature')
+        if signature is None:
+            parts.append(_U16.pack(NO_SIGNATURE))
+        else:
+            # Se decodifica como hex en minúsculas: otra grafía no volvería igual (ni con el mismo txid)
+            if not _is_hex(signature):
+                raise ValueError("Firma sin codificación hexadecimal canónica")
+            raw = bytes.fromhex(signature)
+            parts.append(_U16.pack(len(raw)) + raw)
+        
+        # La comisión es opcional: un byte de flags y el número solo si existe
+        if tx_data.get('fee'):
+            parts.append(_U8.pack(TX_HAS_FEE))
+            self._number(parts, tx_data['fee'])
+        else:
+            parts.append(_U8.pack(0))
+    
+    def transaction(self, tx_data):
+        """Registro de una transacción suelta (formato de exportación)"""
+        parts = [_U8.pack(RECORD_TRANSACTION)]
+        self._transaction(parts, tx_data)
+        return b''.join(parts)
+    
+    def block(self, block_data):
+        """Registro de un bloque con sus transacciones (formato de exportación)"""
+        parts = [_U8.pack(RECORD_BLOCK), _U32.pack(block_data['index'])]
+        self._number(parts, block_data['timestamp'])
+        self._text(parts, block_data['previous_hash'])
+        self._text(parts, block_data['merkle_root'])
+        parts.append(_U64.pack(block_data['nonce']))
+        self._text(parts, block_data['hash'])
+        parts.append(_U32.pack(len(block_data['transactions'])))
+        for tx_data in block_data['transactions']:
+            self._transaction(parts, tx_data)
+        return b''.join(parts)
+
+class WireDecoder:
+    """Decodifica un mensaje del formato binario a dicts en formato de exportación
+    
+    Lee de un objeto tipo archivo, así una respuesta HTTP se procesa registro por
+    registro a medida que llega, sin tenerla completa en memoria.
+    """
+    READ_SIZE = 64 * 1024
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b''
+        self.pos = 0
+        self.key_table = []
+    
+    def _fill(self, length):
+        """Asegura que haya length bytes disponibles en el buffer"""
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        while len(self.buffer) < length:
+            more = self.stream.read(max(self.READ_SIZE, length - len(self.buffer)))
+            if not more:
+                raise Exception("Mensaje binario incompleto")
+            self.buffer += more
+    
+    def _bytes(self, length):
+        if self.pos + length > len(self.buffer):
+            self._fill(length)
+        raw = self.buffer[self.pos:self.pos + length]
+        self.pos += length
+        return raw
+    
+    def _unpack(self, fmt):
+        if self.pos + fmt.size > len(self.buffer):
+            self._fill(fmt.size)
+        value = fmt.unpack_from(self.buffer, self.pos)[0]
+        self.pos += fmt.size
+        return value
+    
+    def _text(self):
+        if self.pos + 3 > len(self.buffer):
+            self._fill(3)
+        tag, length = _TEXT_HEADER.unpack_from(self.buffer, self.pos)
+        self.pos += 3
+        raw = self._bytes(length)
+        return raw.hex() if tag == b'h' else raw.decode()
+    
+    def _number(self):
+        if self.pos + 9 > len(self.buffer):
+            self._fill(9)
+        fmt = _I64 if self.buffer[self.pos] == ord('i') else _F64
+        value = fmt.unpack_from(self.buffer, self.pos + 1)[0]
+        self.pos += 9
+        return value
+    
+    def _transaction(self):
+        tx_data = {
+            'sender_address': self._text(),
+            'recipient_address': self._text(),
+            'amount': self._number(),
+            'timestamp': self._number()
+        }
+        key_ref = self._unpack(_U32)
+        if key_ref == NEW_KEY:
+            self.key_table.append(self._bytes(self._unpack(_U32)).decode())
+            key_ref = len(self.key_table) - 1
+        tx_data['sender_public_key'] = self.key_table[key_ref]
+        
+        signature_length = self._unpack(_U16)
+        tx_data['signature'] = None if signature_length == NO_SIGNATURE else self._bytes(signature_length).hex()
+        
+        if self._unpack(_U8) & TX_HAS_FEE:
+            tx_data['fee'] = self._number()
+        return tx_data
+    
+    def _block(self):
+        block_data = {'index': self._unpack(_U32)}
+        block_data['timestamp'] = self._number()
+        block_data['previous_hash'] = self._text()
+        block_data['merkle_root'] = self._text()
+        block_data['nonce'] = self._unpack(_U64)
+        block_data['hash'] = self._text()
+        block_data['transactions'] = [self._transaction() for _ in range(self._unpack(_U32))]
+        return block_data
+    
+    def read_meta(self):
+        if self._bytes(len(WIRE_MAGIC)) != WIRE_MAGIC:
+            raise Exception("Mensaje binario inválido")
+        return json.loads(self._bytes(self._unpack(_U32)))
+    
+    def records(self):
+        """Itera los registros del mensaje como (tipo, dict)"""
+        while True:
+            kind = self._unpack(_U8)
+            if kind == RECORD_END:
+                return
+            if kind == RECORD_BLOCK:
+                yield kind, self._block()
+            elif kind == RECORD_TRANSACTION:
+                yield kind, self._transaction()
+            else:
+                raise Exception(f"Registro binario desconocido: {kind}")
+
+def encode_message(meta, blocks=(), transactions=()):
+    """Codifica metadatos, bloques y transacciones (dicts de exportación) en un mensaje binario"""
+    encoder = WireEncoder()
+    parts = [encoder.start(meta)]
+    parts.extend(encoder.block(block_data) for block_data in blocks)
+    parts.extend(encoder.transaction(tx_data) for tx_data in transactions)
+    parts.append(encoder.end())
+    return b''.join(parts)
+
+def decode_message(data):
+    """Decodifica un mensaje binario; retorna (metadatos, bloques, transacciones)"""
+    decoder = WireDecoder(io.BytesIO(data))
+    meta = decoder.read_meta()
+    blocks, transactions = [], []
+    for kind, record in decoder.records():
+        (blocks if kind == RECORD_BLOCK else transactions).append(record)
+    return meta, blocks, transactions
+
+def wants_wire_format(req):
+    """Indica si el cliente pidió el formato binario en el header Accept"""
+    return WIRE_MIMETYPE in req.headers.get('Accept', '')
+
+def wire_stream_response(meta, blocks, req):
+    """Respuesta binaria enviada bloque a bloque (chunked), con gzip si el cliente lo acepta"""
+    use_gzip = 'gzip' in req.headers.get('Accept-Encoding', '')
+    
+    def generate():
+        encoder = WireEncoder()
+        # wbits=31: flujo en formato gzip
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 31) if use_gzip else None
+        
+        def emit(data):
+            return compressor.compress(data) if compressor else data
+        
+        yield emit(encoder.start(meta))
+        for block in blocks:
+            chunk = emit(encoder.block(block.to_dict()))
+            if chunk:
+                yield chunk
+        yield emit(encoder.end()) + (compressor.flush() if compressor else b'')
+    
+    response = Response(generate(), mimetype=WIRE_MIMETYPE)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+def json_stream_response(meta, key, items):
+    """Respuesta JSON {meta..., key: [items]} generada elemento a elemento (chunked)"""
+    def generate():
+        head = json.dumps(meta)
+        # Abrir la lista dentro del objeto de metadatos
+        yield (head[:-1] + ', ' if meta else '{') + json.dumps(key) + ': ['
+        for i, item in enumerate(items):
+            yield (', ' if i else '') + json.dumps(item)
+        yield ']}'
+    
+    return Response(generate(), mimetype='application/json')
+
+def iter_chain_blocks(start=0):
+    """Recorre los bloques desde start sin copiar la cadena (hasta el largo actual)"""
+    chain = blockchain.chain
+    for i in range(start, len(chain)):
+        yield chain[i]
+
+def post_wire(url, meta, blocks=(), transactions=(), timeout=5, body=None):
+    """Envía un mensaje binario; si el peer no entiende el formato, reintenta en JSON"""
+    response = http_session.post(
+        url,
+        data=body if body is not None else encode_message(meta, blocks, transactions),
+        headers={'Content-Type': WIRE_MIMETYPE},
+        timeout=timeout
+    )
+    if response.status_code == 415:
+        payload = dict(meta)
+        if blocks:
+            payload['block'] = blocks[0]
+        if transactions:
+            payload.update(transactions[0])
+        response = http_session.post(url, json=payload, timeout=timeout)
+    return response
+
+# ==================== MEMPOOL ====================
+MEMPOOL_MAX_SIZE = int(os.environ.get('MEMPOOL_MAX_SIZE', 5000))
+# Segundos que una transacción puede esperar sin confirmarse
+MEMPOOL_EXPIRY_SECONDS = int(os.environ.get('MEMPOOL_EXPIRY_SECONDS', 3600))
+
+class Mempool:
+    """Transacciones pendientes indexadas por txid, con capacidad y vencimiento"""
+    def __init__(self, max_size=MEMPOOL_MAX_SIZE, expiry_seconds=MEMPOOL_EXPIRY_SECONDS):
+        self.max_size = max_size
+        self.expiry_seconds = expiry_seconds
+        # txid -> (transacción, momento de llegada, bytes, comisión por byte), en orden de llegada
+        self.entries = OrderedDict()
+        # Montículo (comisión por byte, orden de llegada, txid) para hallar la más barata al desalojar;
+        # las entradas de transacciones ya quitadas se descartan al llegar a la cima
+        self.fee_heap = []
+        self.sequence = 0
+        # Remitente -> monto total que ya gasta en transacciones pendientes
+        self.pending_debits = {}
+        self.evicted = 0
+        self.expired = 0
+        self.lock = threading.RLock()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __contains__(self, txid):
+        return txid in self.entries
+    
+    def get(self, txid):
+        entry = self.entries.get(txid)
+        return entry[0] if entry else None
+    
+    def txids(self):
+        with self.lock:
+            return list(self.entries)
+    
+    def oldest_age(self, now=None):
+        """Segundos que lleva esperando la transacción más antigua (0 si no hay)"""
+        with self.lock:
+            if not self.entries:
+                return 0
+            _, arrived, _, _ = next(iter(self.entries.values()))
+            return (now or time.time()) - arrived
+    
+    def get_transactions(self):
+        """Transacciones pendientes en orden de llegada"""
+        with self.lock:
+            self.expire()
+            return [entry[0] for entry in self.entries.values()]
+    
+    def select(self, max_transactions, max_bytes):
+        """Transacciones para un bloque: primero las de mayor comisión por byte, dentro de los límites"""
+        with self.lock:
+            self.expire()
+            # sorted es estable: con la misma comisión por byte se respeta el orden de llegada
+            ranked = sorted(self.entries.values(), key=lambda entry: -entry[3])
+        
+        selected = []
+        used_bytes = 0
+        for tx, _, size, _ in ranked:
+            if len(selected) >= max_transactions:
+                break
+            if used_bytes + size > max_bytes:
+                continue
+            selected.append(tx)
+            used_bytes += size
+        return selected
+    
+    def add(self, tx, txid=None):
+        """Agrega una transacción; retorna False si ya estaba"""
+        txid = txid or tx.calculate_hash()
+        size = tx.size()
+        fee_rate = tx.fee / size
+        with self.lock:
+            if txid in self.entries:
+                return False
+            
+            self.expire()
+            # Lleno: se descarta la de menor comisión por byte, si la nueva paga más
+            if len(self.entries) >= self.max_size:
+                lowest_txid, lowest_rate = self._lowest_fee()
+                if fee_rate <= lowest_rate:
+                    raise Exception("Mempool lleno: la comisión es demasiado baja")
+                self.remove(lowest_txid)
+                self.evicted += 1
+            
+            self.sequence += 1
+            self.entries[txid] = (tx, time.time(), size, fee_rate)
+            heapq.heappush(self.fee_heap, (fee_rate, self.sequence, txid))
+            self._add_debit(tx.sender_address, tx.total_cost())
+            if len(self.fee_heap) > 2 * len(self.entries) + 64:
+                self._rebuild_fee_heap()
+            return True
+    
+    def _lowest_fee(self):
+        """txid y comisión por byte de la transacción más barata (la más antigua si empatan)"""
+        while self.fee_heap[0][2] not in self.entries:
+            heapq.heappop(self.fee_heap)
+        fee_rate, _, txid = self.fee_heap[0]
+        return txid, fee_rate
+    
+    def _rebuild_fee_heap(self):
+        """Descarta del montículo las entradas de transacciones que ya no están"""
+        self.fee_heap = [item for item in self.fee_heap if item[2] in self.entries]
+        heapq.heapify(self.fee_heap)
+    
+    def _add_debit(self, sender, amount):
+        debit = self.pending_debits.get(sender, 0) + amount
+        if debit > 1e-9:
+            self.pending_debits[sender] = debit
+        else:
+            self.pending_debits.pop(sender, None)
+    
+    def pending_debit(self, address):
+        """Monto que una dirección ya comprometió en transacciones pendientes"""
+        return self.pending_debits.get(address, 0)
+    
+    def remove(self, txid):
+        """Quita una transacción; retorna la transacción quitada o None"""
+        with self.lock:
+            entry = self.entries.pop(txid, None)
+            if not entry:
+                return None
+            tx = entry[0]
+            self._add_debit(tx.sender_address, -tx.total_cost())
+            return tx
+    
+    def remove_confirmed(self, block):
+        """Quita las transacciones incluidas en un bloque"""
+        with self.lock:
+            for txid in block.get_txids():
+                self.remove(txid)
+    
+    def revalidate(self, senders, get_balance):
+        """Quita las transacciones más nuevas de los remitentes que ya no tienen fondos para cubrirlas"""
+        with self.lock:
+            overdrawn = {
+                sender for sender in senders
+                if self.pending_debit(sender) > get_balance(sender)
+            }
+            dropped = []
+            if not overdrawn:
+                return dropped
+            
+            for txid, (tx, _, _, _) in reversed(list(self.entries.items())):
+                sender = tx.sender_address
+                if sender in overdrawn:
+                    self.remove(txid)
+                    dropped.append(txid)
+                    if self.pending_debit(sender) <= get_balance(sender):
+                        overdrawn.discard(sender)
+                        if not overdrawn:
+                            break
+            return dropped
+    
+    def expire(self, now=None):
+        """Quita las transacciones que llevan demasiado tiempo sin confirmarse"""
+        now = now or time.time()
+        with self.lock:
+            # Orden de llegada: basta mirar desde el principio
+            while self.entries:
+                txid, (_, arrived, _, _) = next(iter(self.entries.items()))
+                if now - arrived < self.expiry_seconds:
+                    break
+                self.remove(txid)
+                self.expired += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.fee_heap.clear()
+            self.pending_debits.clear()
+    
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'senders': len(self.pending_debits),
+            'expiry_seconds': self.expiry_seconds,
+            'evicted': self.evicted,
+            'expired': self.expired
+        }
 
 # ==================== BLOCKCHAIN ====================
+# Bloques de ramas alternativas más antiguos que esta profundidad se descartan
+SIDE_BRANCH_MAX_DEPTH = int(os.environ.get('SIDE_BRANCH_MAX_DEPTH', 100))
+# Límites de las plantillas de bloque que arma este nodo (incluida la recompensa)
+MAX_BLOCK_TRANSACTIONS = int(os.environ.get('MAX_BLOCK_TRANSACTIONS', 500))
+MAX_BLOCK_BYTES = int(os.environ.get('MAX_BLOCK_BYTES', 512 * 1024))
+
 class Blockchain:
     """Cadena de bloques principal"""
     def __init__(self):
         self.chain = [self.create_genesis_block()]
+        # Dificultad inicial (ceros hexadecimales); luego se ajusta cada RETARGET_INTERVAL bloques
         self.difficulty = 2
-        self.pending_transactions = []
+        self.mempool = Mempool()
         self.mining_reward = 10
+        self.max_block_transactions = MAX_BLOCK_TRANSACTIONS
+        self.max_block_bytes = MAX_BLOCK_BYTES
+        # Procesos usados para el Proof of Work (1 = minado en el hilo actual)
+        self.mining_workers = 1
+        # Índice de balances por dirección (se mantiene al agregar bloques)
+        self.balances = {}
+        # Balances previos de las direcciones que tocó cada bloque reciente, para revertirlo exacto
+        self.balance_undo = OrderedDict()
+        # Índice txid -> (índice de bloque, posición en el bloque)
+        self.tx_index = {}
+        # Índice hash -> altura de los bloques de la cadena principal
+        self.block_heights = {self.chain[0].hash: 0}
+        # Trabajo acumulado de la cadena principal hasta cada altura
+        self.chain_work = [0]
+        # Objetivo de PoW de cada bloque de la cadena principal (el génesis no se mina)
+        self.chain_targets = [None]
+        # Bloques de ramas alternativas: hash -> (bloque, trabajo acumulado, objetivo)
+        self.side_blocks = {}
+        # Prefijo de la cadena ya validado por is_chain_valid
+        self.validated_length = 1
+        self.validated_tip_hash = self.chain[0].hash
+        # Registro en disco (opcional, ver attach_store)
+        self.store = None
+        # Protege la cadena de modificaciones concurrentes (minado, bloques recibidos, sync)
+        self.lock = threading.RLock()
+        # Última instantánea de estado (balances + hash de la punta)
+        self.snapshot_interval = SNAPSHOT_INTERVAL
+        self.latest_snapshot = None
         
     def create_genesis_block(self):
         """Crea el bloque génesis (primer bloque)"""
         return Block(0, [], "0")
     
+    def get_block_by_hash(self, block_hash):
+        """Busca un bloque por su hash en la cadena principal o en una rama alternativa"""
+        height = self.block_heights.get(block_hash)
+        if height is not None:
+            return self.chain[height]
+        side = self.side_blocks.get(block_hash)
+        return side[0] if side else None
+    
+    def get_block_work(self, target):
+        """Trabajo esperado para encontrar un bloque con el objetivo dado (el génesis no se mina)"""
+        if target is None:
+            return 0
+        return target_work(target)
+    
+    def get_max_target(self):
+        """Objetivo más fácil permitido: el de la dificultad inicial"""
+        return difficulty_to_target(self.difficulty)
+    
+    def calculate_next_target(self, height, parent_target, timestamp_at):
+        """Objetivo del bloque en height dado el de su padre; timestamp_at(h) es el timestamp del ancestro en h
+        
+        El primer intervalo incluye al génesis, cuyo timestamp es el de creación del nodo,
+        así que el primer ajuste ocurre recién en la altura 2 * RETARGET_INTERVAL.
+        """
+        if parent_target is None:
+            parent_target = self.get_max_target()
+        if height % RETARGET_INTERVAL != 0 or height <= RETARGET_INTERVAL:
+            return parent_target
+        return retarget(
+            parent_target,
+            timestamp_at(height - RETARGET_INTERVAL),
+            timestamp_at(height - 1),
+            self.get_max_target()
+        )
+    
+    def get_block_target(self, block):
+        """Objetivo que cumplió un bloque de la cadena principal o de una rama alternativa"""
+        height = self.block_heights.get(block.hash)
+        if height is not None:
+            return self.chain_targets[height]
+        return self.side_blocks[block.hash][2]
+    
+    def get_ancestor(self, block, height):
+        """Ancestro en la altura dada de un bloque de la cadena principal o de una rama alternativa"""
+        while block.index > height and block.hash not in self.block_heights:
+            block = self.get_block_by_hash(block.previous_hash)
+        return self.chain[height] if block.index > height else block
+    
+    def get_next_target(self, parent):
+        """Objetivo que debe cumplir un bloque que extiende a parent"""
+        return self.calculate_next_target(
+            parent.index + 1,
+            self.get_block_target(parent),
+            lambda height: self.get_ancestor(parent, height).timestamp
+        )
+    
+    def get_difficulty(self):
+        """Dificultad vigente para el próximo bloque de la punta (ceros hexadecimales, con decimales)"""
+        return target_to_difficulty(self.get_next_target(self.get_latest_block()))
+    
+    def get_chain_work(self):
+        """Trabajo acumulado de la cadena principal"""
+        return self.chain_work[-1]
+    
+    def get_transaction(self, txid):
+        """Transacción pendiente o confirmada por su txid (None si no se conoce)"""
+        tx = self.mempool.get(txid)
+        if tx is not None:
+            return tx
+        location = self.tx_index.get(txid)
+        if location is None:
+            return None
+        block_index, position = location
+        return self.chain[block_index].transactions[position]
+    
     def get_latest_block(self):
         return self.chain[-1]
     
     def add_transaction(self, transaction):
         """Agrega una transacción pendiente"""
+        # Las recompensas solo las crea el minero dentro de su bloque
+        if transaction.sender_address == "MINING_REWARD":
+            raise Exception("Las recompensas de minado no se aceptan como transacciones")
+        
         if not transaction.is_valid():
             raise Exception("Transacción inválida")
         
-        # Solo verificar balance si NO es una recompensa de minado
-        if transaction.sender_address != "MINING_REWARD":
-            sender_balance = self.get_balance(transaction.sender_address)
-            if sender_balance < transaction.amount:
-                raise Exception("Balance insuficiente")
-            
-        self.pending_transactions.append(transaction)
-        return True
+        error = transaction.check_amounts()
+        if error:
+            raise Exception(error)
+        
+        # Verificar y agregar bajo el lock del mempool para que dos envíos simultáneos no gasten lo mismo
+        with self.mempool.lock:
+            available = self.get_available_balance(transaction.sender_address)
+            if available < transaction.total_cost():
+                raise Exception("Balance insuficiente")
+            
+            if not self.mempool.add(transaction):
+                raise Exception("Transacción duplicada")
+        return True
+    
+    def confirm_mempool(self, block):
+        """Quita del mempool lo que confirmó el bloque y lo que sus remitentes ya no pueden pagar"""
+        self.mempool.remove_confirmed(block)
+        senders = {tx.sender_address for tx in block.transactions}
+        dropped = self.mempool.revalidate(senders, self.get_balance)
+        if dropped:
+            print(f"🧹 {len(dropped)} transacciones pendientes descartadas por falta de fondos")
+    
+    def create_block_template(self, mining_reward_address):
+        """Bloque candidato sobre la punta actual: las pendientes que mejor pagan, dentro de los límites"""
+        with self.lock:
+            # Crear transacción de recompensa (su monto se completa con las comisiones)
+            reward_tx = Transaction(
+                "MINING_REWARD",
+                mining_reward_address,
+                self.mining_reward,
+                "SYSTEM"
+            )
+            
+            # Lugar para la recompensa; las demás pendientes quedan para bloques siguientes
+            selected = self.mempool.select(
+                self.max_block_transactions - 1,
+                self.max_block_bytes - reward_tx.size()
+            )
+            fees = sum(tx.fee for tx in selected)
+            if fees:
+                reward_tx.amount = self.mining_reward + fees
+            
+            transactions = selected + [reward_tx]
+            return Block(
+                len(self.chain),
+                transactions,
+                self.get_latest_block().hash
+            )
+    
+    def mine_pending_transactions(self, mining_reward_address, workers=None, should_stop=None):
+        """Mina las transacciones pendientes; retorna None si se abandonó (parada o punta nueva)"""
+        with self.lock:
+            block = self.create_block_template(mining_reward_address)
+            target = self.get_next_target(self.get_latest_block())
+        
+        # Si llega otro bloque a la punta la plantilla ya no sirve
+        def abandoned():
+            if self.get_latest_block().hash != block.previous_hash:
+                return True
+            return should_stop is not None and should_stop()
+        
+        # El PoW corre sin el lock: mientras tanto se siguen aceptando bloques y transacciones
+        print(f"⛏️  Minando bloque con {len(block.transactions)} transacciones...")
+        if block.mine_block(target, workers or self.mining_workers, abandoned) is None:
+            return None
+        
+        with self.lock:
+            if self.get_latest_block().hash != block.previous_hash:
+                print(f"⚠️  La punta cambió durante el minado, bloque #{block.index} descartado")
+                return None
+            
+            # Las mismas reglas que aplicaría cualquier peer (las firmas se verificaron al admitirlas)
+            error = self.validate_block(block, self.get_latest_block(), check_signatures=False)
+            if error:
+                raise Exception(f"Plantilla inválida: {error}")
+            
+            # Agregar el bloque a la cadena
+            self.append_block(block)
+            
+            # Quitar de pendientes las transacciones confirmadas
+            self.confirm_mempool(block)
+        
+        print(f"✅ Bloque #{block.index} agregado a la cadena")
+        return block
+    
+    def check_block(self, block, parent, check_signatures=True):
+        """Valida un bloque que extiende a parent sin mirar balances; retorna el error o None"""
+        if block.index != parent.index + 1:
+            return f"Bloque {block.index}: índice fuera de secuencia"
+        
+        if block.previous_hash != parent.hash:
+            return f"Bloque {block.index}: previous_hash no coincide"
+        
+        if block.merkle_root != block.calculate_merkle_root():
+            return f"Bloque {block.index}: raíz de Merkle no coincide con las transacciones"
+        
+        if block.hash != block.calculate_hash():
+            return f"Bloque {block.index}: hash no coincide con la cabecera"
+        
+        if not hash_meets_target(block.hash, self.get_next_target(parent)):
+            return f"Bloque {block.index}: No cumple dificultad de PoW"
+        
+        if check_signatures and verify_transactions_batch(block.transactions) is not None:
+            return f"Bloque {block.index}: contiene una transacción con firma inválida"
+        
+        return None
+    
+    def validate_block(self, block, parent, check_signatures=True):
+        """Valida un bloque que extiende a parent contra los balances actuales; retorna el error o None"""
+        error = self.check_block(block, parent, check_signatures)
+        if error:
+            return error
+        
+        # Una transacción ya confirmada (o repetida en el bloque) no se puede volver a cobrar
+        txids = set()
+        for txid in block.get_txids():
+            if txid in self.tx_index or txid in txids:
+                return f"Bloque {block.index}: transacción {txid[:10]}... ya confirmada"
+            txids.add(txid)
+        
+        # Balances: cada remitente debe poder pagar (monto y comisión) en el orden del bloque
+        running = {}
+        rewards = []
+        fees = 0
+        for tx in block.transactions:
+            error = tx.check_amounts()
+            if error:
+                return f"Bloque {block.index}: {error.lower()}"
+            if tx.sender_address == "MINING_REWARD":
+                rewards.append(tx)
+            else:
+                fees += tx.fee
+                sender_balance = running.get(tx.sender_address, self.get_balance(tx.sender_address))
+                if sender_balance < tx.total_cost():
+                    return f"Bloque {block.index}: balance insuficiente de {tx.sender_address[:10]}..."
+                running[tx.sender_address] = sender_balance - tx.total_cost()
+            running[tx.recipient_address] = running.get(
+                tx.recipient_address, self.get_balance(tx.recipient_address)
+            ) + tx.amount
+        
+        if len(rewards) != 1:
+            return f"Bloque {block.index}: debe tener exactamente una recompensa de minado"
+        
+        # La recompensa cobra las comisiones del bloque
+        if rewards[0].amount != self.mining_reward + fees:
+            return f"Bloque {block.index}: recompensa de minado incorrecta"
+        
+        return None
+    
+    def add_block(self, block):
+        """Valida un bloque recibido contra la punta actual y lo agrega a la cadena"""
+        with self.lock:
+            error = self.validate_block(block, self.get_latest_block())
+            if error:
+                raise Exception(error)
+            
+            self.append_block(block)
+            self.confirm_mempool(block)
+            # El bloque se validó completo, no hace falta revisarlo de nuevo
+            if self.validated_tip_hash == block.previous_hash:
+                self.mark_validated()
+        return True
+    
+    def add_side_block(self, block):
+        """Guarda un bloque cuyo padre no es la punta; retorna True si su rama pasó a ser la principal"""
+        with self.lock:
+            parent_height = self.block_heights.get(block.previous_hash)
+            if parent_height is not None:
+                parent, parent_work = self.chain[parent_height], self.chain_work[parent_height]
+            elif block.previous_hash in self.side_blocks:
+                parent, parent_work, _ = self.side_blocks[block.previous_hash]
+            else:
+                raise Exception(f"Bloque {block.index}: padre desconocido")
+            
+            # Los balances solo se pueden revisar al cambiar de rama
+            error = self.check_block(block, parent)
+            if error:
+                raise Exception(error)
+            
+            target = self.get_next_target(parent)
+            work = parent_work + self.get_block_work(target)
+            self.side_blocks[block.hash] = (block, work, target)
+            self.prune_side_blocks()
+            if work <= self.get_chain_work():
+                print(f"🌿 Bloque #{block.index} guardado en una rama alternativa")
+                return False
+            
+            # Recorrer la rama hacia atrás hasta la cadena principal
+            branch = [block]
+            while branch[-1].previous_hash not in self.block_heights:
+                side = self.side_blocks.get(branch[-1].previous_hash)
+                if side is None:
+                    return False
+                branch.append(side[0])
+            branch.reverse()
+            
+            self.reorganize(self.block_heights[branch[0].previous_hash], branch)
+            return True
+    
+    def prune_side_blocks(self, max_depth=SIDE_BRANCH_MAX_DEPTH):
+        """Descarta los bloques alternativos demasiado por debajo de la punta"""
+        min_index = len(self.chain) - max_depth
+        for block_hash in [h for h, (block, *_) in self.side_blocks.items() if block.index < min_index]:
+            del self.side_blocks[block_hash]
+    
+    def reorganize(self, fork_height, new_blocks, check_signatures=True):
+        """Cambia a la rama new_blocks, que parte del bloque en fork_height
+        
+        Solo se deshacen los bloques huérfanos (de la punta hacia atrás), que quedan como
+        rama alternativa; sus transacciones que la nueva rama no confirma vuelven al mempool.
+        Si un bloque de la nueva rama no es válido se restaura la rama anterior.
+        """
+        with self.lock:
+            orphaned = self.chain[fork_height + 1:]
+            orphaned_work = self.chain_work[fork_height + 1:]
+            orphaned_targets = self.chain_targets[fork_height + 1:]
+            for block in reversed(orphaned):
+                self.revert_block(block)
+            self._truncate_chain(fork_height + 1)
+            
+            applied = 0
+            error = None
+            for block in new_blocks:
+                # Una excepción a mitad de camino también debe restaurar la rama anterior
+                try:
+                    error = self.validate_block(block, self.chain[-1], check_signatures)
+                    if not error:
+                        self.append_block(block)
+                except Exception as e:
+                    error = f"Bloque {block.index}: {e}"
+                if error:
+                    break
+                self.side_blocks.pop(block.hash, None)
+                applied += 1
+            
+            if error:
+                # Los bloques válidos de la rama siguen siendo una rama alternativa
+                for block, work, target in zip(new_blocks[:applied], self.chain_work[fork_height + 1:],
+                                               self.chain_targets[fork_height + 1:]):
+                    self.side_blocks[block.hash] = (block, work, target)
+                # Incluye el bloque que falló si alcanzó a agregarse
+                for block in reversed(self.chain[fork_height + 1:]):
+                    self.revert_block(block)
+                self._truncate_chain(fork_height + 1)
+                for block in orphaned:
+                    self.append_block(block)
+                # La rama inválida desde el bloque que falló no se vuelve a intentar
+                for block in new_blocks[applied:]:
+                    self.side_blocks.pop(block.hash, None)
+                raise Exception(error)
+            
+            for block, work, target in zip(orphaned, orphaned_work, orphaned_targets):
+                self.side_blocks[block.hash] = (block, work, target)
+            if self.validated_length == fork_height + 1:
+                self.mark_validated()
+            
+            for block in new_blocks:
+                self.mempool.remove_confirmed(block)
+            returned = self.refresh_mempool(orphaned)
+            print(f"🔀 Reorganización en la altura {fork_height}: {len(orphaned)} bloques huérfanos, "
+                  f"{len(new_blocks)} nuevos, {returned} transacciones devueltas al mempool")
+            return orphaned
+    
+    def _truncate_chain(self, height):
+        """Deja la cadena con los primeros height bloques (los índices ya deben estar revertidos)"""
+        # Lista nueva en vez de recortar en el lugar: las respuestas en curso siguen con la anterior
+        self.chain = self.chain[:height]
+        self.chain_work = self.chain_work[:height]
+        self.chain_targets = self.chain_targets[:height]
+        if self.store is not None:
+            self.store.truncate(height)
+        if self.latest_snapshot is not None and not self.snapshot_matches(self.latest_snapshot):
+            self.latest_snapshot = self.store.load_latest_snapshot() if self.store is not None else None
+        if self.validated_length > height:
+            self.validated_length = height
+            self.validated_tip_hash = self.chain[-1].hash
+    
+    def revert_block(self, block):
+        """Deshace el efecto de un bloque de la punta en los balances y los índices"""
+        # Se restauran los valores previos: restar montos en punto flotante deja residuos
+        undo = self.balance_undo.pop(block.hash, None)
+        if undo is None:
+            addresses = set()
+            for tx in block.transactions:
+                addresses.update((tx.sender_address, tx.recipient_address))
+            undo = self.calculate_balances_before(block.index, addresses)
+        for address, balance in undo.items():
+            if balance is None:
+                self.balances.pop(address, None)
+            else:
+                self.balances[address] = balance
+        for txid in block.get_txids():
+            if self.tx_index.get(txid, (None,))[0] == block.index:
+                del self.tx_index[txid]
+        self.block_heights.pop(block.hash, None)
+    
+    def refresh_mempool(self, orphaned=()):
+        """Ajusta el mempool tras cambiar de rama; retorna cuántas transacciones huérfanas volvieron"""
+        with self.mempool.lock:
+            for txid in self.mempool.txids():
+                if txid in self.tx_index:
+                    self.mempool.remove(txid)
+            # Los balances cambiaron: cualquier remitente pendiente puede haber quedado sin fondos
+            self.mempool.revalidate(list(self.mempool.pending_debits), self.get_balance)
+        
+        returned = 0
+        for block in orphaned:
+            for tx in block.transactions:
+                if tx.sender_address == "MINING_REWARD" or tx.calculate_hash() in self.tx_index:
+                    continue
+                try:
+                    self.add_transaction(tx)
+                    returned += 1
+                except Exception:
+                    pass
+        return returned
+    
+    def append_block(self, block):
+        """Agrega un bloque a la cadena y actualiza el índice de balances"""
+        target = self.get_next_target(self.chain[-1])
+        self.chain.append(block)
+        self.chain_targets.append(target)
+        self.chain_work.append(self.chain_work[-1] + self.get_block_work(target))
+        self.block_heights[block.hash] = block.index
+        undo = {}
+        self.apply_block_balances(block, undo)
+        self.balance_undo[block.hash] = undo
+        while len(self.balance_undo) > SIDE_BRANCH_MAX_DEPTH:
+            self.balance_undo.popitem(last=False)
+        self.index_block_transactions(block)
+        block.get_summary()
+        if self.store is not None:
+            self.store.append(block)
+        if len(self.chain) % self.snapshot_interval == 0:
+            self.take_snapshot()
+    
+    def replace_chain(self, new_chain):
+        """Reemplaza la cadena completa y reconstruye los índices"""
+        self.chain = new_chain
+        self.rebuild_balances()
+        self.rebuild_tx_index()
+        self.rebuild_chain_index()
+        self.invalidate_validation()
+        if self.store is not None:
+            self.store.reset(new_chain)
+        # La instantánea de la cadena anterior ya no corresponde (y reset la borró del disco)
+        if self.latest_snapshot is not None and not self.snapshot_matches(self.latest_snapshot):
+            self.latest_snapshot = None
+    
+    def validate_chain(self, chain):
+        """Valida una cadena ajena completa desde su génesis: enlaces, PoW, recompensas y balances
+        
+        No toca la cadena actual (usa una copia de trabajo) y no revisa firmas, que se verifican
+        aparte en lote. Retorna el error o None.
+        """
+        genesis = chain[0]
+        if genesis.index != 0 or genesis.previous_hash != "0" or genesis.transactions:
+            return "Bloque génesis inválido"
+        
+        candidate = Blockchain()
+        candidate.difficulty = self.difficulty
+        candidate.mining_reward = self.mining_reward
+        # La copia solo sirve para validar: sin instantáneas
+        candidate.snapshot_interval = len(chain) + 1
+        candidate.replace_chain([genesis])
+        for block in chain[1:]:
+            try:
+                error = candidate.validate_block(block, candidate.get_latest_block(), check_signatures=False)
+                if not error:
+                    candidate.append_block(block)
+            except Exception as e:
+                error = f"Bloque {block.index}: {e}"
+            if error:
+                return error
+        return None
     
-    def mine_pending_transactions(self, mining_reward_address):
-        """Mina las transacciones pendientes"""
-        # Crear transacción de recompensa
-        reward_tx = Transaction(
-            "MINING_REWARD",
-            mining_reward_address,
-            self.mining_reward,
-            "SYSTEM"
-        )
+    def take_snapshot(self):
+        """Crea una instantánea del estado actual (y la guarda en disco si hay registro)"""
+        self.latest_snapshot = {
+            'height': len(self.chain),
+            'tip_hash': self.chain[-1].hash,
+            'balances': dict(self.balances),
+            'created_at': time.time()
+        }
+        if self.store is not None:
+            self.store.save_snapshot(self.latest_snapshot)
+        print(f"📸 Instantánea de estado en la altura {len(self.chain)}")
+        return self.latest_snapshot
+    
+    def snapshot_matches(self, snapshot):
+        """Indica si la instantánea corresponde a un prefijo de la cadena actual"""
+        height = snapshot['height']
+        return 0 < height <= len(self.chain) and self.chain[height - 1].hash == snapshot['tip_hash']
+    
+    def mark_validated(self):
+        """Marca la cadena actual como ya validada"""
+        self.validated_length = len(self.chain)
+        self.validated_tip_hash = self.chain[-1].hash
+    
+    def attach_store(self, store):
+        """Conecta un registro en disco: carga la cadena guardada o guarda la actual"""
+        self.store = store
+        if len(store) == 0:
+            store.reset(self.chain)
+            return
         
-        # Agregar la recompensa a las transacciones pendientes
-        self.pending_transactions.append(reward_tx)
+        start = time.time()
+        self.chain = store.load_blocks()
+        snapshot = store.load_latest_snapshot()
+        if snapshot is not None and self.snapshot_matches(snapshot):
+            self.latest_snapshot = snapshot
+        self.rebuild_balances(self.latest_snapshot)
+        self.rebuild_tx_index()
+        self.rebuild_chain_index()
+        # La cadena propia en disco ya fue validada antes de guardarse
+        self.mark_validated()
+        print(f"💾 {len(self.chain)} bloques cargados desde {store.directory} en {(time.time() - start) * 1000:.1f} ms")
+    
+    def get_locator(self):
+        """Hashes de la cadena en alturas cada vez más espaciadas (punta, -1, -2, -4, ..., génesis)"""
+        locator = []
+        height = len(self.chain) - 1
+        step = 1
+        while height > 0:
+            locator.append({'index': height, 'hash': self.chain[height].hash})
+            if len(locator) >= 2:
+                step *= 2
+            height -= step
+        locator.append({'index': 0, 'hash': self.chain[0].hash})
+        return locator
+    
+    def locate_fork(self, locator):
+        """Mayor altura del localizador que coincide con la cadena local (-1 si ninguna)"""
+        for entry in locator:
+            height = entry['index']
+            if 0 <= height < len(self.chain) and self.chain[height].hash == entry['hash']:
+                return height
+        return -1
+    
+    def get_header_targets(self, headers, parent):
+        """Objetivo de cada cabecera de una secuencia que extiende a parent (None para un génesis)
         
-        # Crear el bloque con TODAS las transacciones (incluyendo la recompensa)
-        block = Block(
-            len(self.chain),
-            self.pending_transactions.copy(),  # Usar copia para no perder referencia
-            self.get_latest_block().hash
-        )
+        Los timestamps anteriores a la secuencia se toman de la cadena local, que comparte
+        esos bloques hasta parent.
+        """
+        start = headers[0]['index'] if headers else 0
         
-        # Minar el bloque
-        print(f"⛏️  Minando bloque con {len(self.pending_transactions)} transacciones...")
-        block.mine_block(self.difficulty)
+        def timestamp_at(height):
+            return headers[height - start]['timestamp'] if height >= start else self.chain[height].timestamp
         
-        # Agregar el bloque a la cadena
-        self.chain.append(block)
+        targets = []
+        target = self.chain_targets[parent['index']] if parent is not None else None
+        for header in headers:
+            if header['index'] > 0:
+                target = self.calculate_next_target(header['index'], target, timestamp_at)
+            targets.append(target)
+        return targets
+    
+    def validate_headers(self, headers, parent):
+        """Valida enlace, hash y PoW (con el objetivo de cada altura) de una secuencia de cabeceras; retorna el error o None"""
+        previous = parent
+        for header, target in zip(headers, self.get_header_targets(headers, parent)):
+            if previous is None:
+                # Sin ancestro común la secuencia debe empezar en un génesis
+                if header['index'] != 0 or header['previous_hash'] != "0":
+                    return f"Cabecera {header['index']}: no parte de un bloque génesis"
+            else:
+                if header['index'] != previous['index'] + 1:
+                    return f"Cabecera {header['index']}: índice fuera de secuencia"
+                if header['previous_hash'] != previous['hash']:
+                    return f"Cabecera {header['index']}: previous_hash no coincide"
+                if not hash_meets_target(header['hash'], target):
+                    return f"Cabecera {header['index']}: No cumple dificultad de PoW"
+            
+            if header['hash'] != calculate_header_hash(header):
+                return f"Cabecera {header['index']}: hash no coincide"
+            previous = header
+        return None
+    
+    def invalidate_validation(self):
+        """Descarta el resultado cacheado de is_chain_valid"""
+        self.validated_length = 1
+        self.validated_tip_hash = self.chain[0].hash
+    
+    def index_block_transactions(self, block):
+        """Registra los txid de un bloque en el índice de transacciones"""
+        for position, txid in enumerate(block.get_txids()):
+            self.tx_index[txid] = (block.index, position)
+    
+    def rebuild_tx_index(self):
+        """Reconstruye el índice de transacciones recorriendo toda la cadena"""
+        self.tx_index = {}
+        for block in self.chain:
+            self.index_block_transactions(block)
+    
+    def rebuild_chain_index(self):
+        """Reconstruye el índice de hashes, los objetivos y el trabajo acumulado (solo usa las cabeceras)"""
+        self.block_heights = {}
+        self.chain_work = []
+        self.chain_targets = []
+        work = 0
+        target = None
+        for block in self.chain:
+            if block.index > 0:
+                target = self.calculate_next_target(block.index, target, lambda height: self.chain[height].timestamp)
+            work += self.get_block_work(target)
+            self.chain_targets.append(target)
+            self.chain_work.append(work)
+            self.block_heights[block.hash] = block.index
+        self.side_blocks = {}
+    
+    def get_transaction_proof(self, txid):
+        """Prueba de inclusión de una transacción confirmada (None si no está en la cadena)"""
+        location = self.tx_index.get(txid)
+        if location is None:
+            return None
         
-        # Limpiar transacciones pendientes
-        self.pending_transactions = []
+        block_index, position = location
+        block = self.chain[block_index]
+        return {
+            'txid': txid,
+            'block_index': block_index,
+            'block_hash': block.hash,
+            'header': block.get_header(),
+            'position': position,
+            'branch': block.get_merkle_proof(position),
+            'confirmations': len(self.chain) - block_index
+        }
+    
+    def apply_block_balances(self, block, undo=None):
+        """Aplica las transacciones de un bloque al índice de balances
         
-        print(f"✅ Bloque #{block.index} agregado a la cadena")
-        return block
+        Si se pasa undo, se guarda ahí el balance previo (None si no había) de cada dirección tocada.
+        """
+        for tx in block.transactions:
+            if undo is not None:
+                for address in (tx.sender_address, tx.recipient_address):
+                    if address not in undo:
+                        undo[address] = self.balances.get(address)
+            self.balances[tx.sender_address] = self.balances.get(tx.sender_address, 0) - tx.total_cost()
+            self.balances[tx.recipient_address] = self.balances.get(tx.recipient_address, 0) + tx.amount
+    
+    def rebuild_balances(self, snapshot=None):
+        """Reconstruye el índice de balances, desde una instantánea si corresponde a la cadena"""
+        start = 0
+        self.balances = {}
+        self.balance_undo = OrderedDict()
+        if snapshot is not None and self.snapshot_matches(snapshot):
+            self.balances = dict(snapshot['balances'])
+            start = snapshot['height']
         
+        for block in self.chain[start:]:
+            self.apply_block_balances(block)
+    
     def get_balance(self, address):
         """Obtiene el balance de una dirección"""
-        balance = 0
+        return self.balances.get(address, 0)
+    
+    def get_available_balance(self, address):
+        """Balance confirmado menos lo comprometido en transacciones pendientes"""
+        return self.get_balance(address) - self.mempool.pending_debit(address)
+    
+    def calculate_balances_before(self, height, addresses):
+        """Balances de las direcciones dadas con los bloques anteriores a height (None si no aparecían)
         
+        Suma en el mismo orden que el índice, así que el resultado coincide exactamente con él.
+        """
+        balances = dict.fromkeys(addresses)
+        for block in self.chain[:height]:
+            for tx in block.transactions:
+                if tx.sender_address in balances:
+                    balances[tx.sender_address] = (balances[tx.sender_address] or 0) - tx.total_cost()
+                if tx.recipient_address in balances:
+                    balances[tx.recipient_address] = (balances[tx.recipient_address] or 0) + tx.amount
+        return balances
+    
+    def verify_balances(self):
+        """Compara el índice de balances con un recorrido completo de la cadena"""
+        expected = {}
         for block in self.chain:
             for tx in block.transactions:
-                if tx.sender_address == address:
-                    balance -= tx.amount
-                if tx.recipient_address == address:
-                    balance += tx.amount
-                    
-        return balance
+                expected[tx.sender_address] = expected.get(tx.sender_address, 0) - tx.total_cost()
+                expected[tx.recipient_address] = expected.get(tx.recipient_address, 0) + tx.amount
+        
+        mismatches = {}
+        for address in set(expected) | set(self.balances):
+            if expected.get(address, 0) != self.balances.get(address, 0):
+                mismatches[address] = {
+                    'index': self.balances.get(address, 0),
+                    'chain': expected.get(address, 0)
+                }
+        return mismatches
     
     def is_chain_valid(self):
-        """Verifica la integridad de la blockchain"""
-        for i in range(1, len(self.chain)):
+        """Verifica la integridad de la blockchain (solo los bloques no validados antes)"""
+        start = self.validated_length
+        if start > len(self.chain) or self.chain[start - 1].hash != self.validated_tip_hash:
+            start = 1
+        
+        transactions = []
+        tx_blocks = []
+        for i in range(start, len(self.chain)):
             current_block = self.chain[i]
             previous_block = self.chain[i-1]
             
+            if current_block.merkle_root != current_block.calculate_merkle_root():
+                return False
+            
             if current_block.hash != current_block.calculate_hash():
                 return False
             
             if current_block.previous_hash != previous_block.hash:
                 return False
             
-            for tx in current_block.transactions:
-                if not tx.is_valid():
-                    return False
-                    
+            transactions.extend(current_block.transactions)
+            tx_blocks.extend([i] * len(current_block.transactions))
+        
+        # Las firmas de todos los bloques nuevos se verifican juntas en paralelo
+        invalid = verify_transactions_batch(transactions)
+        if invalid is not None:
+            print(f"❌ Firma inválida en el bloque {tx_blocks[invalid[0]]}")
+            return False
+        
+        self.validated_length = len(self.chain)
+        self.validated_tip_hash = self.chain[-1].hash
         return True
 
+# ==================== RED ====================
+BROADCAST_WORKERS = int(os.environ.get('BROADCAST_WORKERS', 8))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+# Peers elegidos al azar a los que se anuncia cada inventario
+GOSSIP_FANOUT = int(os.environ.get('GOSSIP_FANOUT', 3))
+# Ids de transacciones y bloques ya anunciados o pedidos, para cortar los bucles de propagación
+SEEN_INVENTORY_SIZE = int(os.environ.get('SEEN_INVENTORY_SIZE', 20000))
+
+def create_http_session(pool_size=HTTP_POOL_SIZE):
+    """Sesión HTTP que reutiliza conexiones a cada peer"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+http_session = create_http_session()
+
+# Espera tras el primer fallo de un peer; se duplica con cada fallo seguido
+PEER_BACKOFF_SECONDS = float(os.environ.get('PEER_BACKOFF_SECONDS', 2))
+PEER_MAX_BACKOFF_SECONDS = float(os.environ.get('PEER_MAX_BACKOFF_SECONDS', 300))
+# Fallos seguidos tras los que un peer se descarta
+PEER_MAX_FAILURES = int(os.environ.get('PEER_MAX_FAILURES', 8))
+
+class PeerManager:
+    """Peers conocidos con su latencia, fallos y espera antes de volver a contactarlos"""
+    def __init__(self, backoff_seconds=PEER_BACKOFF_SECONDS, max_backoff_seconds=PEER_MAX_BACKOFF_SECONDS,
+                 max_failures=PEER_MAX_FAILURES):
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_failures = max_failures
+        # url -> estado del peer
+        self.peers = {}
+        self.evicted = 0
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.peers)
+    
+    def __contains__(self, url):
+        return url in self.peers
+    
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.peers))
+    
+    def add(self, url):
+        """Registra un peer; si ya existía lo da por vivo de nuevo"""
+        with self.lock:
+            peer = self.peers.get(url)
+            if peer is None:
+                self.peers[url] = {
+                    'sent': 0, 'failures': 0, 'consecutive_failures': 0,
+                    'last_latency_ms': None, 'avg_latency_ms': None,
+                    'last_seen': None, 'retry_at': 0
+                }
+            else:
+                peer['consecutive_failures'] = 0
+                peer['retry_at'] = 0
+    
+    def remove(self, url):
+        with self.lock:
+            self.peers.pop(url, None)
+    
+    def mark_seen(self, url):
+        """Un mensaje recibido del peer también prueba que está vivo"""
+        with self.lock:
+            peer = self.peers.get(url)
+            if peer is not None:
+                peer['last_seen'] = time.time()
+                peer['consecutive_failures'] = 0
+                peer['retry_at'] = 0
+    
+    def record_success(self, url, seconds=None):
+        with self.lock:
+            peer = self.peers.get(url)
+            if peer is None:
+                return
+            peer['sent'] += 1
+            peer['last_seen'] = time.time()
+            peer['consecutive_failures'] = 0
+            peer['retry_at'] = 0
+            if seconds is None:
+                return
+            latency_ms = round(seconds * 1000, 2)
+            peer['last_latency_ms'] = latency_ms
+            # Promedio móvil para suavizar picos aislados
+            previous = peer['avg_latency_ms']
+            peer['avg_latency_ms'] = latency_ms if previous is None else round(previous * 0.8 + latency_ms * 0.2, 2)
+    
+    def record_failure(self, url):
+        """Cuenta un fallo: espera exponencial y descarte tras demasiados fallos seguidos"""
+        with self.lock:
+            peer = self.peers.get(url)
+            if peer is None:
+                return
+            peer['sent'] += 1
+            peer['failures'] += 1
+            peer['consecutive_failures'] += 1
+            if peer['consecutive_failures'] >= self.max_failures:
+                del self.peers[url]
+                self.evicted += 1
+                print(f"🗑️  Peer {url} descartado tras {self.max_failures} fallos seguidos")
+                return
+            backoff = min(
+                self.backoff_seconds * 2 ** (peer['consecutive_failures'] - 1),
+                self.max_backoff_seconds
+            )
+            peer['retry_at'] = time.time() + backoff
+    
+    def available(self, exclude=None):
+        """Peers que no están esperando tras un fallo"""
+        now = time.time()
+        with self.lock:
+            return [
+                url for url, peer in self.peers.items()
+                if url != exclude and peer['retry_at'] <= now
+            ]
+    
+    def best(self, exclude=None):
+        """Peers disponibles del más rápido al más lento; los aún no medidos van al final"""
+        with self.lock:
+            latency = {url: peer['avg_latency_ms'] for url, peer in self.peers.items()}
+        return sorted(
+            self.available(exclude),
+            key=lambda url: (latency.get(url) is None, latency.get(url) or 0)
+        )
+    
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            return {
+                url: dict(
+                    {key: value for key, value in peer.items() if key != 'retry_at'},
+                    backoff_seconds=round(max(0, peer['retry_at'] - now), 2)
+                )
+                for url, peer in self.peers.items()
+            }
+
+class PeerBroadcaster:
+    """Envía mensajes a los peers en paralelo, fuera del request del cliente"""
+    def __init__(self, peers, workers=BROADCAST_WORKERS):
+        self.peers = peers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='broadcast')
+    
+    def submit(self, fn, *args):
+        """Ejecuta una tarea de red en segundo plano"""
+        return self.executor.submit(fn, *args)
+    
+    def broadcast(self, peers, path, meta, blocks=(), transactions=(), timeout=5, label='mensaje'):
+        """Encola un envío a cada peer y retorna sin esperar las respuestas"""
+        body = encode_message(meta, blocks, transactions)
+        for peer in list(peers):
+            self.executor.submit(self._send, peer, path, body, meta, blocks, transactions, timeout, label)
+    
+    def _send(self, peer, path, body, meta, blocks, transactions, timeout, label):
+        start = time.perf_counter()
+        try:
+            response = post_wire(f"{peer}{path}", meta, blocks, transactions, timeout, body=body)
+            if response.status_code >= 500:
+                raise Exception(f"respuesta {response.status_code}")
+            if response.status_code >= 300:
+                print(f"⚠️  {peer} respondió {response.status_code} a {label}")
+        except Exception as e:
+            print(f"❌ Error enviando {label} a {peer}: {str(e)}")
+            self.peers.record_failure(peer)
+            return
+        self.peers.record_success(peer, time.perf_counter() - start)
+
+# ==================== MINERO EN SEGUNDO PLANO ====================
+# Minado automático: cantidad de transacciones pendientes o espera máxima que disparan un bloque
+MINER_AUTO_MIN_TRANSACTIONS = int(os.environ.get('MINER_AUTO_MIN_TRANSACTIONS', 1))
+MINER_AUTO_MAX_WAIT_SECONDS = float(os.environ.get('MINER_AUTO_MAX_WAIT_SECONDS', 30))
+# Trabajos terminados que se recuerdan para /mine/status
+MINER_JOBS_TO_KEEP = 50
+
+class BackgroundMiner:
+    """Hilo que mina fuera de los requests: trabajos pedidos por /mine y minado automático"""
+    def __init__(self, blockchain, on_block=None):
+        self.blockchain = blockchain
+        self.on_block = on_block
+        # job_id -> estado del trabajo, en orden de creación
+        self.jobs = OrderedDict()
+        self.queue = []
+        self.current_job = None
+        self.auto = None
+        self.next_job_id = 1
+        self.blocks_mined = 0
+        self.templates_abandoned = 0
+        self.thread = None
+        self.wake = threading.Event()
+        self.cancel = threading.Event()
+        self.lock = threading.Lock()
+    
+    def _ensure_thread(self):
+        # Se crea recién al usarlo: con el reloader de debug solo existe en el proceso que atiende
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='miner', daemon=True)
+            self.thread.start()
+    
+    def submit(self, reward_address, workers=None, source='manual'):
+        """Encola un trabajo de minado y retorna su estado"""
+        with self.lock:
+            job = {
+                'job_id': self.next_job_id,
+                'status': 'queued',
+                'source': source,
+                'reward_address': reward_address,
+                'workers': workers or self.blockchain.mining_workers,
+                'created_at': time.time(),
+                'attempts': 0
+            }
+            self.next_job_id += 1
+            self.jobs[job['job_id']] = job
+            self.queue.append(job)
+            # Olvidar los trabajos terminados más antiguos
+            finished = [job_id for job_id, old in self.jobs.items() if old['status'] not in ('queued', 'mining')]
+            for job_id in finished[:max(0, len(self.jobs) - MINER_JOBS_TO_KEEP)]:
+                del self.jobs[job_id]
+        self._ensure_thread()
+        self.wake.set()
+        return dict(job)
+    
+    def start_auto(self, reward_address, min_transactions=MINER_AUTO_MIN_TRANSACTIONS,
+                   max_wait_seconds=MINER_AUTO_MAX_WAIT_SECONDS, workers=None):
+        """Activa el minado automático cuando el mempool supera los umbrales"""
+        with self.lock:
+            self.auto = {
+                'reward_address': reward_address,
+                'min_transactions': min_transactions,
+                'max_wait_seconds': max_wait_seconds,
+                'workers': workers
+            }
+        self._ensure_thread()
+        self.wake.set()
+        return dict(self.auto)
+    
+    def stop(self):
+        """Desactiva el minado automático y cancela el trabajo en curso y los encolados"""
+        with self.lock:
+            self.auto = None
+            for job in self.queue:
+                job['status'] = 'cancelled'
+            self.queue = []
+            self.cancel.set()
+        self.wake.set()
+    
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def status(self):
+        with self.lock:
+            return {
+                'running': self.current_job is not None,
+                'current_job': dict(self.current_job) if self.current_job else None,
+                'queued': len(self.queue),
+                'auto': dict(self.auto) if self.auto else None,
+                'blocks_mined': self.blocks_mined,
+                'templates_abandoned': self.templates_abandoned,
+                'recent_jobs': [dict(job) for job in list(self.jobs.values())[-10:]]
+            }
+    
+    def _auto_due(self):
+        """Indica si el mempool superó alguno de los umbrales del minado automático"""
+        mempool = self.blockchain.mempool
+        auto = self.auto
+        if auto is None or len(mempool) == 0:
+            return False
+        return (len(mempool) >= auto['min_transactions'] or
+                mempool.oldest_age() >= auto['max_wait_seconds'])
+    
+    def _next_job(self):
+        auto = self.auto
+        if not self.queue and auto is not None and self._auto_due():
+            self.submit(auto['reward_address'], auto['workers'], source='auto')
+        with self.lock:
+            if not self.queue:
+                return None
+            # La señal se limpia en el mismo paso en que se saca el trabajo: un stop()
+            # posterior ya lo ve como el trabajo en curso y no se pierde
+            self.cancel.clear()
+            job = self.queue.pop(0)
+            self.current_job = job
+            job['status'] = 'mining'
+            job['started_at'] = time.time()
+            return job
+    
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                # Sin trabajos: revisar los umbrales cada segundo o al recibir un pedido
+                self.wake.wait(timeout=1)
+                self.wake.clear()
+                continue
+            self._mine(job)
+    
+    def _mine(self, job):
+        block = None
+        try:
+            # Si otro nodo extiende la punta se abandona la plantilla y se arma otra sobre la nueva
+            while block is None and not self.cancel.is_set():
+                job['attempts'] += 1
+                balance_before = self.blockchain.get_balance(job['reward_address'])
+                block = self.blockchain.mine_pending_transactions(
+                    job['reward_address'], job['workers'], self.cancel.is_set
+                )
+                if block is None and not self.cancel.is_set():
+                    self.templates_abandoned += 1
+                    print(f"🔁 Nueva punta recibida, reiniciando el minado sobre ella")
+        except Exception as e:
+            print(f"❌ Error minando: {str(e)}")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        
+        with self.lock:
+            self.current_job = None
+            job['finished_at'] = time.time()
+            if block is None:
+                job.setdefault('error', None)
+                if job['status'] != 'failed':
+                    job['status'] = 'cancelled'
+                return
+            self.blocks_mined += 1
+            job.update({
+                'status': 'done',
+                'reward': self.blockchain.mining_reward,
+                'balance_before': balance_before,
+                'new_balance': self.blockchain.get_balance(job['reward_address']),
+                'blocks_count': len(self.blockchain.chain),
+                'block_index': block.index,
+                'block_hash': block.hash,
+                'transactions_in_block': len(block.transactions),
+                'mining_workers': block.mining_stats['workers'],
+                'hashes': block.mining_stats['hashes'],
+                'difficulty': block.mining_stats['difficulty'],
+                'mining_seconds': block.mining_stats['seconds'],
+                'hash_rate': block.mining_stats['hash_rate']
+            })
+        
+        if self.on_block is not None:
+            self.on_block(block)
+
 # ==================== NODO (API REST) ====================
 app = Flask(__name__)
 CORS(app)
@@ -232,7 +2514,13 @@ app.config['PORT'] = 5000
 
 blockchain = Blockchain()
 node_wallet = None
-peer_nodes = set()
+peer_nodes = PeerManager()
+broadcaster = PeerBroadcaster(peer_nodes)
+seen_inventory = LRUCache(SEEN_INVENTORY_SIZE)
+
+def node_url():
+    """URL con la que este nodo se presenta a sus peers"""
+    return f"http://localhost:{app.config['PORT']}"
 
 @app.route('/wallet/create', methods=['POST'])
 def create_wallet():
@@ -240,12 +2528,18 @@ def create_wallet():
     global node_wallet
     data = request.get_json()
     owner_name = data.get('owner_name', 'Anonymous')
+    scheme = data.get('scheme', DEFAULT_SIGNATURE_SCHEME)
+    
+    if scheme not in SIGNATURE_SCHEMES:
+        return jsonify({'error': f'Esquema de firma no soportado: {scheme}',
+                        'schemes': list(SIGNATURE_SCHEMES)}), 400
     
-    node_wallet = Wallet(owner_name)
+    node_wallet = Wallet(owner_name, scheme)
     
     return jsonify({
         'message': 'Wallet creada exitosamente',
         'owner': owner_name,
+        'scheme': node_wallet.scheme.name,
         'address': node_wallet.get_address(),
         'balance': blockchain.get_balance(node_wallet.get_address())
     }), 201
@@ -258,6 +2552,7 @@ def wallet_info():
     
     return jsonify({
         'owner': node_wallet.owner_name,
+        'scheme': node_wallet.scheme.name,
         'address': node_wallet.get_address(),
         'balance': blockchain.get_balance(node_wallet.get_address())
     })
@@ -271,6 +2566,7 @@ def create_transaction():
     data = request.get_json()
     recipient = data.get('recipient_address')
     amount = data.get('amount')
+    fee = data.get('fee', 0)
     
     if not recipient or not amount:
         return jsonify({'error': 'Faltan datos'}), 400
@@ -280,7 +2576,8 @@ def create_transaction():
             node_wallet.get_address(),
             recipient,
             float(amount),
-            node_wallet.get_public_key_pem()
+            node_wallet.get_public_key_pem(),
+            float(fee) if fee else 0
         )
         
         signature = node_wallet.sign_transaction(tx.to_dict())
@@ -295,12 +2592,14 @@ def create_transaction():
         return jsonify({
             'message': 'Transacción creada y propagada',
             'transaction': {
+                'txid': tx.calculate_hash(),
                 'sender': tx.sender_address,
                 'recipient': tx.recipient_address,
                 'amount': tx.amount,
+                'fee': tx.fee,
                 'timestamp': datetime.fromtimestamp(tx.timestamp).strftime('%Y-%m-%d %H:%M:%S')
             },
-            'pending_count': len(blockchain.pending_transactions)
+            'pending_count': len(blockchain.mempool)
         }), 201
     except Exception as e:
         print(f"❌ Error creando transacción: {str(e)}")
@@ -308,233 +2607,494 @@ def create_transaction():
 
 @app.route('/mine', methods=['POST'])
 def mine_block():
-    """Mina un nuevo bloque con las transacciones pendientes"""
+    """Pide al minero en segundo plano un bloque con las transacciones pendientes"""
     if not node_wallet:
         return jsonify({'error': 'Primero crea una wallet para recibir recompensas'}), 400
     
     # Mostrar transacciones pendientes antes de minar
-    pending_count = len(blockchain.pending_transactions)
-    print(f"\n⛏️  Iniciando minado...")
+    pending_transactions = blockchain.mempool.get_transactions()
+    pending_count = len(pending_transactions)
+    print(f"\n⛏️  Minado solicitado...")
     print(f"📋 Transacciones pendientes: {pending_count}")
     
-    for i, tx in enumerate(blockchain.pending_transactions):
-        print(f"   {i+1}. {tx.sender_address[:10]}... → {tx.recipient_address[:10]}... ({tx.amount} tokens)")
+    for i, tx in enumerate(pending_transactions):
+        print(f"   {i+1}. {tx.sender_address[:10]}... → {tx.recipient_address[:10]}... ({tx.amount} tokens, comisión {tx.fee})")
     
-    # Obtener balance ANTES de minar
-    balance_before = blockchain.get_balance(node_wallet.get_address())
-    
-    # Minar el bloque (esto incluye la recompensa automáticamente)
-    block = blockchain.mine_pending_transactions(node_wallet.get_address())
+    # Cantidad de procesos para el PoW (opcional en el body)
+    data = request.get_json(silent=True) or {}
+    try:
+        workers = parse_mining_workers(data, blockchain.mining_workers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Obtener balance DESPUÉS de minar
-    balance_after = blockchain.get_balance(node_wallet.get_address())
+    # El PoW corre en el hilo del minero; el cliente consulta el resultado en /mine/status
+    job = miner.submit(node_wallet.get_address(), workers)
+    return jsonify({
+        'message': 'Minado en curso',
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'pending_count': pending_count,
+        'status_url': f"/mine/status?job={job['job_id']}"
+    }), 202
+
+@app.route('/mine/status', methods=['GET'])
+def mine_status():
+    """Estado de un trabajo de minado (?job=<id>) o del minero completo"""
+    job_id = request.args.get('job', type=int)
+    if job_id is None:
+        return jsonify(miner.status())
     
-    print(f"✅ Bloque minado con {len(block.transactions)} transacciones")
-    print(f"💰 Balance: {balance_before} → {balance_after} tokens")
+    job = miner.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job)
+
+@app.route('/mine/start', methods=['POST'])
+def mine_start():
+    """Activa el minado automático al superar umbrales de transacciones pendientes o de espera"""
+    if not node_wallet:
+        return jsonify({'error': 'Primero crea una wallet para recibir recompensas'}), 400
     
-    # Propagar el nuevo bloque a los peers
-    broadcast_new_block()
+    data = request.get_json(silent=True) or {}
+    try:
+        auto = miner.start_auto(
+            node_wallet.get_address(),
+            min_transactions=int(data.get('min_transactions', MINER_AUTO_MIN_TRANSACTIONS)),
+            max_wait_seconds=float(data.get('max_wait_seconds', MINER_AUTO_MAX_WAIT_SECONDS)),
+            workers=parse_mining_workers(data)
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    print(f"🤖 Minado automático activado: {auto['min_transactions']} transacciones o {auto['max_wait_seconds']}s de espera")
+    return jsonify({'message': 'Minado automático activado', 'auto': auto})
+
+@app.route('/mine/stop', methods=['POST'])
+def mine_stop():
+    """Desactiva el minado automático y cancela el minado en curso"""
+    miner.stop()
+    print(f"⏹️  Minado detenido")
+    return jsonify({'message': 'Minado detenido', 'status': miner.status()})
+
+def on_block_mined(block):
+    """Propaga a los peers un bloque minado por este nodo"""
+    print(f"💰 Bloque #{block.index} minado con {len(block.transactions)} transacciones")
+    broadcast_new_block(block)
+
+miner = BackgroundMiner(blockchain, on_block=on_block_mined)
+
+def parse_mining_workers(data, default=None):
+    """Lee 'workers' del body, limitado a 1..cantidad de CPUs; ValueError si no es un entero"""
+    value = data.get('workers', default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("workers debe ser un entero")
+    try:
+        workers = int(value)
+    except ValueError:
+        raise ValueError("workers debe ser un entero")
+    # Cada cantidad distinta recrea el pool de procesos: no tiene sentido pasar de los núcleos
+    return max(1, min(workers, os.cpu_count() or 1))
+
+def chain_page_bounds():
+    """Rango [inicio, fin) pedido con ?latest=N o ?from=<índice>&limit=N (por defecto toda la cadena)"""
+    length = len(blockchain.chain)
+    latest = request.args.get('latest', type=int)
+    if latest is not None:
+        return max(0, length - max(0, latest)), length
     
-    return jsonify({
-        'message': 'Bloque minado exitosamente',
-        'reward': blockchain.mining_reward,
-        'balance_before': balance_before,
-        'new_balance': balance_after,
-        'blocks_count': len(blockchain.chain),
-        'block_index': block.index,
-        'block_hash': block.hash,
-        'transactions_in_block': len(block.transactions)
-    })
+    start = min(length, max(0, request.args.get('from', 0, type=int)))
+    limit = request.args.get('limit', type=int)
+    end = length if limit is None else min(length, start + max(0, limit))
+    return start, end
+
+def chain_etag(start, end):
+    """ETag fuerte: la altura y el hash de la punta identifican el estado de la cadena"""
+    return f"{len(blockchain.chain)}-{blockchain.get_latest_block().hash}-{start}-{end}"
+
+def conditional_response(etag):
+    """304 si el cliente ya tiene esta versión (If-None-Match), None si hay que generarla"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def with_etag(response, etag):
+    """Agrega el ETag y pide al navegador revalidar en cada consulta"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/blockchain', methods=['GET'])
 def get_blockchain():
-    """Obtiene la blockchain completa"""
-    chain_data = []
-    for block in blockchain.chain:
-        chain_data.append({
-            'index': block.index,
-            'timestamp': datetime.fromtimestamp(block.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'transactions': len(block.transactions),
-            'hash': block.hash,
-            'previous_hash': block.previous_hash,
-            'nonce': block.nonce
-        })
+    """Obtiene la blockchain (completa, ?latest=N o ?from=<índice>&limit=N)"""
+    start, end = chain_page_bounds()
+    etag = chain_etag(start, end)
+    cached = conditional_response(etag)
+    if cached is not None:
+        return cached
     
-    return jsonify({
+    chain_data = [blockchain.chain[i].get_summary() for i in range(start, end)]
+    
+    return with_etag(jsonify({
         'length': len(blockchain.chain),
+        'from': start,
         'chain': chain_data,
-        'valid': blockchain.is_chain_valid()
-    })
+        'valid': blockchain.is_chain_valid(),
+        'difficulty': blockchain.get_difficulty(),
+        'target_block_seconds': TARGET_BLOCK_SECONDS
+    }), etag)
 
 @app.route('/blockchain/full', methods=['GET'])
 def get_full_blockchain():
-    """Obtiene la blockchain con todas las transacciones"""
-    chain_data = []
-    for block in blockchain.chain:
-        transactions = []
-        for tx in block.transactions:
-            transactions.append({
-                'sender': tx.sender_address,
-                'recipient': tx.recipient_address,
-                'amount': tx.amount,
-                'timestamp': datetime.fromtimestamp(tx.timestamp).strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        chain_data.append({
-            'index': block.index,
-            'timestamp': datetime.fromtimestamp(block.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
-            'transactions': transactions,
-            'hash': block.hash,
-            'previous_hash': block.previous_hash
-        })
+    """Obtiene la blockchain con todas las transacciones (enviada bloque a bloque)"""
+    start, end = chain_page_bounds()
+    etag = chain_etag(start, end)
+    cached = conditional_response(etag)
+    if cached is not None:
+        return cached
     
-    return jsonify({'chain': chain_data})
+    chain = blockchain.chain
+    full_blocks = (chain[i].get_full_summary() for i in range(start, end))
+    return with_etag(json_stream_response({}, 'chain', full_blocks), etag)
 
 @app.route('/blockchain/export', methods=['GET'])
 def export_blockchain():
-    """Exporta la blockchain completa para sincronización"""
-    chain_data = []
+    """Exporta la blockchain (completa o desde ?from=<índice>) bloque a bloque para sincronización"""
+    start = max(0, request.args.get('from', 0, type=int))
+    meta = {
+        'length': len(blockchain.chain),
+        'from': start,
+        'valid': blockchain.is_chain_valid()
+    }
     
-    for block in blockchain.chain:
-        transactions = []
-        for tx in block.transactions:
-            transactions.append({
-                'sender_address': tx.sender_address,
-                'recipient_address': tx.recipient_address,
-                'amount': tx.amount,
-                'timestamp': tx.timestamp,
-                'sender_public_key': tx.sender_public_key,
-                'signature': tx.signature
-            })
-        
-        chain_data.append({
-            'index': block.index,
-            'timestamp': block.timestamp,
-            'transactions': transactions,
-            'hash': block.hash,
-            'previous_hash': block.previous_hash,
-            'nonce': block.nonce
-        })
+    # Formato binario compacto si el cliente lo pide (Accept)
+    if wants_wire_format(request):
+        return wire_stream_response(meta, iter_chain_blocks(start), request)
+    
+    return json_stream_response(meta, 'chain', (block.to_dict() for block in iter_chain_blocks(start)))
+
+@app.route('/blockchain/headers', methods=['GET'])
+def export_headers():
+    """Cabeceras de bloque (con su hash) desde ?from=<índice>, sin transacciones"""
+    start = max(0, request.args.get('from', 0, type=int))
+    headers = []
+    for block in blockchain.chain[start:]:
+        header = block.get_header()
+        header['hash'] = block.hash
+        headers.append(header)
     
+    return jsonify({'length': len(blockchain.chain), 'from': start, 'headers': headers})
+
+@app.route('/blockchain/locate', methods=['POST'])
+def locate_fork():
+    """Encuentra el último bloque en común a partir del localizador de otro nodo"""
+    data = request.get_json()
+    locator = data.get('locator', [])
     return jsonify({
+        'fork_index': blockchain.locate_fork(locator),
         'length': len(blockchain.chain),
-        'chain': chain_data,
-        'valid': blockchain.is_chain_valid()
+        'work': blockchain.get_chain_work()
     })
 
 @app.route('/blockchain/sync', methods=['POST'])
 def sync_blockchain():
-    """Sincroniza la blockchain con otro nodo"""
-    data = request.get_json()
+    """Sincroniza la blockchain con otro nodo descargando solo los bloques que faltan"""
+    data = request.get_json(silent=True) or {}
     peer_url = data.get('peer_url')
     
-    if not peer_url:
-        return jsonify({'error': 'No se proporcionó peer_url'}), 400
+    if peer_url:
+        result, status = sync_with_peer(peer_url)
+        return jsonify(result), status
+    
+    # Sin peer indicado: probar los peers disponibles del más rápido al más lento
+    candidates = peer_nodes.best()
+    if not candidates:
+        return jsonify({'error': 'No se proporcionó peer_url y no hay peers disponibles'}), 400
     
+    for peer_url in candidates:
+        result, status = sync_with_peer(peer_url)
+        if status < 500:
+            result['peer_url'] = peer_url
+            return jsonify(result), status
+    return jsonify(result), status
+
+def sync_with_peer(peer_url):
+    """Sincroniza con un peer registrando si respondió; retorna (respuesta, código HTTP)"""
+    result, status = _sync_with_peer(peer_url)
+    if status >= 500:
+        peer_nodes.record_failure(peer_url)
+    else:
+        peer_nodes.mark_seen(peer_url)
+    return result, status
+
+def _sync_with_peer(peer_url):
+    """Sincroniza con un peer; retorna (respuesta, código HTTP)"""
     try:
         print(f"\n🔄 Intentando sincronizar con {peer_url}...")
         
-        # Obtener la blockchain del peer
-        response = requests.get(f"{peer_url}/blockchain/export", timeout=10)
+        # 1. Buscar el último bloque en común con el peer
+        response = http_session.post(
+            f"{peer_url}/blockchain/locate",
+            json={'locator': blockchain.get_locator()},
+            timeout=10
+        )
         if response.status_code != 200:
-            print(f"❌ No se pudo obtener blockchain del peer: {response.status_code}")
-            return jsonify({'error': 'No se pudo obtener blockchain del peer'}), 400
-        
-        peer_data = response.json()
-        peer_chain_data = peer_data.get('chain', [])
+            print(f"❌ No se pudo consultar al peer: {response.status_code}")
+            return {'error': 'No se pudo obtener blockchain del peer'}, 400
         
+        located = response.json()
+        fork_index = located['fork_index']
+        peer_length = located['length']
+        peer_work = located.get('work')
         local_length = len(blockchain.chain)
-        peer_length = len(peer_chain_data)
+        local_work = blockchain.get_chain_work()
+        local_tip_hash = blockchain.get_latest_block().hash
         
-        print(f"📊 Longitudes - Local: {local_length}, Peer: {peer_length}")
+        print(f"📊 Longitudes - Local: {local_length}, Peer: {peer_length}, ancestro común: {fork_index}")
         
-        # Si la cadena del peer es más larga, reemplazar
-        if peer_length > local_length:
-            print(f"⬇️  La cadena del peer es más larga. Sincronizando...")
-            
-            # Crear una nueva cadena temporal
-            temp_chain = []
-            
-            for block_data in peer_chain_data:
-                transactions = []
-                
-                # Reconstruir transacciones
-                for tx_data in block_data.get('transactions', []):
-                    tx = Transaction(
-                        tx_data['sender_address'],
-                        tx_data['recipient_address'],
-                        tx_data['amount'],
-                        tx_data['sender_public_key']
-                    )
-                    tx.timestamp = tx_data['timestamp']
-                    if tx_data.get('signature'):
-                        tx.sign_transaction(tx_data['signature'])
-                    transactions.append(tx)
-                
-                # Crear bloque
-                block = Block(
-                    block_data['index'],
-                    transactions,
-                    block_data['previous_hash'],
-                    block_data.get('nonce', 0)
-                )
-                
-                # CRÍTICO: Asignar timestamp ANTES de asignar el hash
-                block.timestamp = block_data['timestamp']
-                
-                # Ahora asignar el hash (que ya está calculado con este timestamp)
-                block.hash = block_data['hash']
-                
-                temp_chain.append(block)
+        # Gana la cadena con más trabajo acumulado (un peer sin ese dato solo informa el largo)
+        if peer_work is not None:
+            peer_ahead = peer_work > local_work
+        else:
+            peer_ahead = peer_length > local_length
+        if not peer_ahead:
+            print(f"ℹ️  La blockchain local ya está actualizada o tiene más trabajo")
+            return {
+                'message': 'La blockchain local ya está actualizada',
+                'length': len(blockchain.chain)
+            }, 200
+        
+        print(f"⬇️  La cadena del peer tiene más trabajo. Descargando desde el bloque {fork_index + 1}...")
+        start = fork_index + 1
+        
+        # 2. Primero las cabeceras: validar enlace y PoW antes de bajar transacciones
+        response = http_session.get(f"{peer_url}/blockchain/headers", params={'from': start}, timeout=10)
+        if response.status_code != 200:
+            return {'error': 'No se pudo obtener cabeceras del peer'}, 400
+        headers = response.json().get('headers', [])
+        
+        parent = None
+        if fork_index >= 0:
+            parent = blockchain.chain[fork_index].get_header()
+            parent['hash'] = blockchain.chain[fork_index].hash
+        
+        error = blockchain.validate_headers(headers, parent)
+        if error:
+            print(f"❌ {error}")
+            return {'error': 'Blockchain del peer es inválida'}, 400
+        
+        # El trabajo se calcula de las cabeceras ya validadas, no se toma el que informa el peer
+        branch_work = blockchain.chain_work[fork_index] if fork_index >= 0 else 0
+        branch_work += sum(blockchain.get_block_work(target) for target in blockchain.get_header_targets(headers, parent))
+        if branch_work <= local_work:
+            print(f"ℹ️  La rama del peer no tiene más trabajo que la local")
+            return {
+                'message': 'La blockchain local ya está actualizada',
+                'length': len(blockchain.chain)
+            }, 200
+        
+        # 3. Luego solo los bloques que faltan
+        # Los bloques se procesan a medida que llegan, sin cargar la respuesta completa
+        new_blocks = []
+        is_valid = True
+        for block in stream_peer_blocks(peer_url, start):
+            # El peer pudo minar más bloques después de enviar las cabeceras: basta con los anunciados
+            if len(new_blocks) == len(headers):
+                break
+            header = headers[len(new_blocks)]
+            if block.hash != header['hash']:
+                print(f"❌ Bloque {block.index}: no coincide con su cabecera")
+                is_valid = False
+                break
             
-            # Validación manual
-            is_valid = True
+            if block.merkle_root != block.calculate_merkle_root():
+                print(f"❌ Bloque {block.index}: raíz de Merkle no coincide con las transacciones")
+                is_valid = False
+                break
             
-            for i in range(1, len(temp_chain)):
-                current = temp_chain[i]
-                previous = temp_chain[i-1]
-                
-                if current.previous_hash != previous.hash:
-                    print(f"❌ Bloque {i}: previous_hash no coincide")
-                    is_valid = False
-                    break
-                
-                if not current.hash.startswith('0' * blockchain.difficulty):
-                    print(f"❌ Bloque {i}: No cumple dificultad de PoW")
-                    is_valid = False
-                    break
+            # El hash se recalcula del cuerpo: copiar el de una cabecera válida no alcanza
+            if block.calculate_hash() != header['hash']:
+                print(f"❌ Bloque {block.index}: hash no coincide con la cabecera")
+                is_valid = False
+                break
+            new_blocks.append(block)
+        
+        if is_valid and len(new_blocks) != len(headers):
+            print(f"❌ El peer envió {len(new_blocks)} bloques de {len(headers)} anunciados")
+            is_valid = False
+        
+        # 4. Verificar en paralelo las firmas de las transacciones recibidas
+        if is_valid:
+            transactions = [tx for block in new_blocks for tx in block.transactions]
+            invalid = verify_transactions_batch(transactions)
+            if invalid is not None:
+                print(f"❌ Transacción {invalid[0]} con firma inválida")
+                is_valid = False
+        
+        extends_tip = fork_index == local_length - 1
+        new_chain = blockchain.chain[:start] + new_blocks
+        if is_valid and fork_index < 0:
+            # Cadena sin ancestro común: se valida completa (balances incluidos) antes de adoptarla
+            error = blockchain.validate_chain(new_chain)
+            if error:
+                print(f"❌ {error}")
+                is_valid = False
+        
+        if not is_valid:
+            print(f"❌ La cadena del peer NO pasó la validación")
+            return {'error': 'Blockchain del peer es inválida'}, 400
+        
+        with blockchain.lock:
+            # Mientras se descargaba pudo llegar o minarse otro bloque
+            if blockchain.get_latest_block().hash != local_tip_hash:
+                print(f"⚠️  La cadena local cambió durante la sincronización")
+                return {'error': 'La cadena local cambió durante la sincronización'}, 409
             
-            if is_valid:
-                print(f"✅ Cadena del peer es válida. Reemplazando local...")
-                blockchain.chain = temp_chain
-                blockchain.pending_transactions = []
-                print(f"✅ Sincronización completada: {local_length} -> {peer_length} bloques")
-                return jsonify({
-                    'message': 'Blockchain sincronizada exitosamente',
-                    'old_length': local_length,
-                    'new_length': len(blockchain.chain)
-                }), 200
+            if extends_tip:
+                # El peer solo extiende nuestra cadena: validar y agregar los bloques nuevos
+                print(f"✅ Cabeceras del peer válidas. Agregando {len(new_blocks)} bloques...")
+                was_validated = blockchain.validated_tip_hash == local_tip_hash
+                error = None
+                for block in new_blocks:
+                    # Las firmas ya se verificaron en lote
+                    try:
+                        error = blockchain.validate_block(block, blockchain.get_latest_block(), check_signatures=False)
+                    except Exception as e:
+                        error = f"Bloque {block.index}: {e}"
+                    if error:
+                        break
+                    blockchain.append_block(block)
+                    blockchain.confirm_mempool(block)
+                # Solo los bloques que pasaron validate_block cuentan como validados
+                if was_validated:
+                    blockchain.mark_validated()
+                if error:
+                    print(f"❌ {error}")
+                    return {'error': 'Blockchain del peer es inválida'}, 400
+            elif fork_index >= 0:
+                # Rama con más trabajo: deshacer solo los bloques huérfanos y aplicar los nuevos
+                print(f"✅ Rama del peer válida. Reorganizando desde el bloque {start}...")
+                try:
+                    blockchain.reorganize(fork_index, new_blocks, check_signatures=False)
+                except Exception as e:
+                    # reorganize ya restauró la rama local
+                    print(f"❌ {e}")
+                    return {'error': 'Blockchain del peer es inválida'}, 400
             else:
-                print(f"❌ La cadena del peer NO pasó la validación")
-                return jsonify({'error': 'Blockchain del peer es inválida'}), 400
-        else:
-            print(f"ℹ️  La blockchain local ya está actualizada o es más larga")
-            return jsonify({
-                'message': 'La blockchain local ya está actualizada',
-                'length': len(blockchain.chain)
-            }), 200
+                # Sin ancestro común: se reemplaza la cadena completa
+                print(f"✅ Cadena del peer es válida. Reemplazando desde el bloque {start}...")
+                orphaned = blockchain.chain[start:]
+                blockchain.replace_chain(new_chain)
+                blockchain.refresh_mempool(orphaned)
+                blockchain.mark_validated()
+        
+        print(f"✅ Sincronización completada: {local_length} -> {len(blockchain.chain)} bloques")
+        return {
+            'message': 'Blockchain sincronizada exitosamente',
+            'old_length': local_length,
+            'new_length': len(blockchain.chain),
+            'blocks_downloaded': len(new_blocks)
+        }, 200
             
     except Exception as e:
         print(f"❌ Error en sincronización: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({'error': f'Error en sincronización: {str(e)}'}), 500
+        return {'error': f'Error en sincronización: {str(e)}'}, 500
+
+@app.route('/transaction/<txid>/proof', methods=['GET'])
+def get_transaction_proof(txid):
+    """Prueba de Merkle de que una transacción está incluida en un bloque"""
+    proof = blockchain.get_transaction_proof(txid)
+    if proof is None:
+        if txid in blockchain.mempool:
+            return jsonify({'txid': txid, 'status': 'pending'}), 202
+        return jsonify({'error': 'Transacción no encontrada'}), 404
+    
+    proof['status'] = 'confirmed'
+    return jsonify(proof)
+
+def stream_peer_blocks(peer_url, start):
+    """Descarga bloques de un peer desde start y los entrega uno a uno mientras llegan"""
+    response = http_session.get(
+        f"{peer_url}/blockchain/export",
+        params={'from': start},
+        headers={'Accept': f"{WIRE_MIMETYPE}, application/json;q=0.5"},
+        stream=True,
+        timeout=10
+    )
+    with response:
+        if response.status_code != 200:
+            raise Exception(f"No se pudo obtener bloques del peer: {response.status_code}")
+        
+        if not response.headers.get('Content-Type', '').startswith(WIRE_MIMETYPE):
+            for block_data in response.json().get('chain', []):
+                yield Block.from_dict(block_data)
+            return
+        
+        # Descomprimir (gzip) al vuelo y leer registro por registro
+        response.raw.decode_content = True
+        decoder = WireDecoder(response.raw)
+        decoder.read_meta()
+        for kind, record in decoder.records():
+            if kind == RECORD_BLOCK:
+                yield Block.from_dict(record)
+
+@app.route('/snapshot/latest', methods=['GET'])
+def get_latest_snapshot():
+    """Última instantánea de estado del nodo (balances + hash de la punta)"""
+    if blockchain.latest_snapshot is None:
+        return jsonify({'error': 'No hay instantáneas todavía'}), 404
+    return jsonify(blockchain.latest_snapshot)
 
 @app.route('/balance/<address>', methods=['GET'])
 def get_balance(address):
     """Obtiene el balance de una dirección"""
     balance = blockchain.get_balance(address)
-    return jsonify({'address': address, 'balance': balance})
+    return jsonify({
+        'address': address,
+        'balance': balance,
+        'pending': blockchain.mempool.pending_debit(address),
+        'available': blockchain.get_available_balance(address)
+    })
+
+@app.route('/balances/verify', methods=['GET'])
+def verify_balances():
+    """Verifica el índice de balances contra un recorrido completo de la cadena"""
+    mismatches = blockchain.verify_balances()
+    return jsonify({
+        'consistent': not mismatches,
+        'addresses': len(blockchain.balances),
+        'mismatches': mismatches
+    })
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Estadísticas de las cachés de verificación"""
+    return jsonify({
+        'verified_signatures': verified_signatures.stats(),
+        'public_keys': public_key_cache.stats(),
+        'seen_inventory': seen_inventory.stats(),
+        'validated_blocks': blockchain.validated_length
+    })
+
+@app.route('/mempool', methods=['GET'])
+def get_mempool():
+    """Estado de las transacciones pendientes"""
+    stats = blockchain.mempool.stats()
+    stats['transactions'] = [
+        {
+            'txid': tx.calculate_hash(),
+            'sender': tx.sender_address,
+            'recipient': tx.recipient_address,
+            'amount': tx.amount,
+            'fee': tx.fee
+        }
+        for tx in blockchain.mempool.get_transactions()
+    ]
+    return jsonify(stats)
 
 @app.route('/peers/register', methods=['POST'])
 def register_peer():
@@ -549,73 +3109,220 @@ def register_peer():
 
 @app.route('/peers', methods=['GET'])
 def get_peers():
-    """Lista todos los peers"""
-    return jsonify({'peers': list(peer_nodes)})
+    """Lista todos los peers con su salud: latencia, fallos, última respuesta y espera"""
+    return jsonify({
+        'peers': list(peer_nodes),
+        'available': peer_nodes.best(),
+        'evicted': peer_nodes.evicted,
+        'stats': peer_nodes.stats()
+    })
 
-def broadcast_transaction(transaction):
-    """Propaga una transacción a todos los nodos peer"""
-    tx_dict = transaction.to_dict()
-    tx_dict['signature'] = transaction.signature
+def announce(inventory, exclude=None):
+    """Anuncia ids de transacciones y bloques a un subconjunto aleatorio de peers"""
+    for item in inventory:
+        seen_inventory.put((item['type'], item['id']), True)
+    
+    peers = peer_nodes.available(exclude)
+    targets = random.sample(peers, min(GOSSIP_FANOUT, len(peers)))
+    if targets:
+        print(f"📡 Anunciando {len(inventory)} ids a {len(targets)} peers...")
+    broadcaster.broadcast(
+        targets, '/inv', {'peer_url': node_url(), 'inventory': inventory}, timeout=2, label='inv'
+    )
+
+def broadcast_transaction(transaction, exclude=None):
+    """Anuncia una transacción a la red"""
+    announce([{'type': 'tx', 'id': transaction.calculate_hash()}], exclude)
+
+def broadcast_new_block(block, exclude=None):
+    """Anuncia un bloque nuevo a la red"""
+    announce([{'type': 'block', 'id': block.hash}], exclude)
+
+def has_inventory(kind, item_id):
+    """Indica si el nodo ya tiene la transacción o el bloque"""
+    if kind == 'tx':
+        return item_id in blockchain.mempool or item_id in blockchain.tx_index
+    return blockchain.get_block_by_hash(item_id) is not None
+
+def fetch_inventory(peer_url, wanted):
+    """Pide al peer los cuerpos anunciados que faltan, los procesa y los vuelve a anunciar"""
+    try:
+        response = http_session.post(
+            f"{peer_url}/getdata",
+            json={'inventory': wanted},
+            headers={'Accept': f"{WIRE_MIMETYPE}, application/json;q=0.5"},
+            timeout=5
+        )
+        if response.status_code != 200:
+            raise Exception(f"respuesta {response.status_code}")
+        if response.headers.get('Content-Type', '').startswith(WIRE_MIMETYPE):
+            _, blocks, transactions = decode_message(response.content)
+        else:
+            data = response.json()
+            blocks, transactions = data.get('blocks', []), data.get('transactions', [])
+    except Exception as e:
+        # Se olvidan los ids para poder pedirlos a otro peer que los anuncie
+        for item in wanted:
+            seen_inventory.discard((item['type'], item['id']))
+        print(f"❌ Error pidiendo inventario a {peer_url}: {str(e)}")
+        peer_nodes.record_failure(peer_url)
+        return
     
-    for peer in peer_nodes:
+    peer_nodes.mark_seen(peer_url)
+    
+    relay = []
+    for tx_data in transactions:
         try:
-            print(f"📡 Propagando TX a {peer}...")
-            response = requests.post(
-                f"{peer}/transaction/receive", 
-                json=tx_dict,
-                timeout=2
-            )
-            if response.status_code == 200:
-                print(f"✅ TX recibida por {peer}")
-            else:
-                print(f"⚠️  {peer} respondió: {response.status_code}")
+            tx = Transaction.from_dict(tx_data)
+            blockchain.add_transaction(tx)
+            relay.append({'type': 'tx', 'id': tx.calculate_hash()})
+            print(f"✅ Transacción recibida por gossip: {tx.amount} tokens")
         except Exception as e:
-            print(f"❌ Error propagando a {peer}: {str(e)}")
-
-def broadcast_new_block():
-    """Propaga un nuevo bloque a todos los peers"""
-    for peer in peer_nodes:
+            print(f"⚠️  Transacción de {peer_url} rechazada: {str(e)}")
+    
+    for block_data in blocks:
         try:
-            requests.post(
-                f"{peer}/blockchain/sync",
-                json={'peer_url': f"http://localhost:{app.config['PORT']}"},
-                timeout=5
-            )
-        except:
-            pass
+            block = Block.from_dict(block_data)
+            _, status = accept_block(block, peer_url)
+            if status == 200 and block.hash in blockchain.block_heights:
+                relay.append({'type': 'block', 'id': block.hash})
+        except Exception as e:
+            print(f"⚠️  Bloque de {peer_url} rechazado: {str(e)}")
+    
+    if relay:
+        announce(relay, exclude=peer_url)
+
+@app.route('/inv', methods=['POST'])
+def receive_inventory():
+    """Recibe un anuncio de ids y pide en segundo plano los que el nodo no tiene"""
+    payload = read_request_payload()
+    if payload is None:
+        return jsonify({'error': 'Formato no soportado'}), 415
+    
+    data = payload[0]
+    peer_url = data.get('peer_url')
+    peer_nodes.mark_seen(peer_url)
+    wanted = []
+    for item in data.get('inventory', []):
+        kind, item_id = item.get('type'), item.get('id')
+        if kind not in ('tx', 'block') or not item_id:
+            continue
+        if seen_inventory.get((kind, item_id)) or has_inventory(kind, item_id):
+            continue
+        # Marcar antes de pedir: si otro peer anuncia lo mismo no se pide dos veces
+        seen_inventory.put((kind, item_id), True)
+        wanted.append({'type': kind, 'id': item_id})
+    
+    if wanted and peer_url:
+        broadcaster.submit(fetch_inventory, peer_url, wanted)
+    return jsonify({'requested': len(wanted)}), 200
+
+@app.route('/getdata', methods=['POST'])
+def get_data():
+    """Entrega los cuerpos de las transacciones y bloques pedidos por id"""
+    data = request.get_json() or {}
+    blocks, transactions = [], []
+    for item in data.get('inventory', []):
+        if item.get('type') == 'tx':
+            tx = blockchain.get_transaction(item.get('id'))
+            if tx is not None:
+                transactions.append(tx.to_signed_dict())
+        elif item.get('type') == 'block':
+            block = blockchain.get_block_by_hash(item.get('id'))
+            if block is not None:
+                blocks.append(block.to_dict())
+    
+    if wants_wire_format(request):
+        return Response(encode_message({}, blocks, transactions), mimetype=WIRE_MIMETYPE)
+    return jsonify({'blocks': blocks, 'transactions': transactions})
+
+def read_request_payload():
+    """Lee el cuerpo de un POST en formato binario o JSON; retorna (datos, bloques, transacciones)"""
+    if request.mimetype == WIRE_MIMETYPE:
+        return decode_message(request.get_data())
+    if not request.is_json:
+        return None
+    data = request.get_json()
+    blocks = [data['block']] if data.get('block') else []
+    transactions = [data] if 'sender_address' in data else []
+    return data, blocks, transactions
+
+@app.route('/block/receive', methods=['POST'])
+def receive_block():
+    """Recibe un bloque nuevo de otro nodo y lo agrega si extiende la punta local"""
+    payload = read_request_payload()
+    if payload is None:
+        return jsonify({'error': 'Formato no soportado'}), 415
+    
+    data, blocks, _ = payload
+    peer_url = data.get('peer_url')
+    peer_nodes.mark_seen(peer_url)
+    
+    if not blocks:
+        return jsonify({'error': 'No se envió el bloque'}), 400
+    
+    try:
+        block = Block.from_dict(blocks[0])
+        result, status = accept_block(block, peer_url)
+        if status == 200 and block.hash in blockchain.block_heights and not seen_inventory.get(('block', block.hash)):
+            broadcast_new_block(block, exclude=peer_url)
+        return jsonify(result), status
+    except Exception as e:
+        print(f"❌ Error recibiendo bloque: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+def accept_block(block, peer_url=None):
+    """Agrega un bloque recibido si extiende la punta local; retorna (respuesta, status)"""
+    with blockchain.lock:
+        tip = blockchain.get_latest_block()
+        
+        existing = blockchain.get_block_by_hash(block.hash)
+        if existing is not None and existing.index == block.index:
+            return {'message': 'El bloque ya existe'}, 200
+        
+        if block.previous_hash == tip.hash:
+            blockchain.add_block(block)
+            print(f"✅ Bloque #{block.index} recibido y agregado")
+            return {'message': 'Bloque agregado', 'length': len(blockchain.chain)}, 200
+        
+        # Padre conocido pero no es la punta: rama alternativa (o reorganización si pasa a tener más trabajo)
+        if blockchain.get_block_by_hash(block.previous_hash) is not None:
+            if blockchain.add_side_block(block):
+                return {'message': 'Reorganizado a una rama con más trabajo', 'length': len(blockchain.chain)}, 200
+            return {'message': 'Bloque guardado en una rama alternativa'}, 202
+    
+    # No conocemos al padre: puede haber una rama con más trabajo, sincronizar con quien lo envió
+    if peer_url:
+        print(f"🔄 Bloque #{block.index} con padre desconocido, sincronizando con {peer_url}...")
+        return sync_with_peer(peer_url)
+    
+    print(f"⚠️  Bloque #{block.index} no extiende la punta local, ignorado")
+    return {'error': 'El bloque no extiende la cadena local'}, 409
 
 @app.route('/transaction/receive', methods=['POST'])
 def receive_transaction():
     """Recibe una transacción de otro nodo"""
-    data = request.get_json()
+    payload = read_request_payload()
+    if payload is None:
+        return jsonify({'error': 'Formato no soportado'}), 415
+    
+    _, _, transactions = payload
+    if not transactions:
+        return jsonify({'error': 'No se envió la transacción'}), 400
+    
+    data = transactions[0]
     try:
-        # Verificar si ya existe en pending_transactions
-        tx_exists = False
-        for pending_tx in blockchain.pending_transactions:
-            if (pending_tx.sender_address == data['sender_address'] and
-                pending_tx.recipient_address == data['recipient_address'] and
-                pending_tx.amount == data['amount'] and
-                pending_tx.timestamp == data['timestamp']):
-                tx_exists = True
-                break
+        tx = Transaction.from_dict(data)
+        txid = tx.calculate_hash()
         
-        if tx_exists:
+        # Duplicados: búsqueda O(1) por txid en pendientes y en la cadena
+        if txid in blockchain.mempool or txid in blockchain.tx_index:
             print(f"⚠️  Transacción duplicada ignorada")
             return jsonify({'message': 'Transacción ya existe'}), 200
         
-        tx = Transaction(
-            data['sender_address'],
-            data['recipient_address'],
-            data['amount'],
-            data['sender_public_key']
-        )
-        tx.timestamp = data['timestamp']
-        
-        if data.get('signature'):
-            tx.sign_transaction(data['signature'])
-        
         blockchain.add_transaction(tx)
         print(f"✅ Transacción recibida: {data['amount']} tokens")
+        broadcast_transaction(tx)
         return jsonify({'message': 'Transacción recibida'}), 200
     except Exception as e:
         print(f"❌ Error recibiendo transacción: {str(e)}")
@@ -629,12 +3336,25 @@ def index():
             'POST /wallet/create': 'Crear wallet',
             'GET /wallet/info': 'Info de wallet',
             'POST /transaction/create': 'Crear transacción',
-            'POST /mine': 'Minar bloque',
-            'GET /blockchain': 'Ver blockchain',
-            'GET /blockchain/full': 'Ver blockchain completa',
-            'GET /blockchain/export': 'Exportar blockchain',
+            'POST /mine': 'Minar bloque (en segundo plano)',
+            'GET /mine/status': 'Estado del minero (?job=<id>)',
+            'POST /mine/start': 'Activar minado automático',
+            'POST /mine/stop': 'Detener minado',
+            'GET /blockchain': 'Ver blockchain (?latest=N, ?from=<índice>&limit=N)',
+            'GET /blockchain/full': 'Ver blockchain completa (?latest=N, ?from=<índice>&limit=N)',
+            'GET /blockchain/export': 'Exportar blockchain (?from=<índice>)',
+            'GET /blockchain/headers': 'Cabeceras de bloque (?from=<índice>)',
+            'POST /blockchain/locate': 'Buscar ancestro común',
             'POST /blockchain/sync': 'Sincronizar blockchain',
+            'POST /block/receive': 'Recibir bloque de otro nodo',
+            'POST /inv': 'Recibir anuncio de transacciones y bloques',
+            'POST /getdata': 'Pedir transacciones y bloques por id',
+            'GET /transaction/<txid>/proof': 'Prueba de inclusión de Merkle',
+            'GET /snapshot/latest': 'Última instantánea de estado',
             'GET /balance/<address>': 'Consultar balance',
+            'GET /balances/verify': 'Verificar índice de balances',
+            'GET /mempool': 'Transacciones pendientes',
+            'GET /cache/stats': 'Estadísticas de cachés',
             'POST /peers/register': 'Registrar peer',
             'GET /peers': 'Listar peers'
         }
@@ -644,6 +3364,15 @@ if __name__ == '__main__':
     import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
     app.config['PORT'] = port
+    # Segundo argumento opcional: procesos para minar en paralelo
+    if len(sys.argv) > 2:
+        blockchain.mining_workers = max(1, int(sys.argv[2]))
+    debug = True
+    # Con el reloader de debug solo el proceso hijo (el que atiende) abre el registro
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        data_dir = os.environ.get('BLOCKCHAIN_DATA_DIR', 'datos')
+        blockchain.attach_store(BlockStore(os.path.join(data_dir, f'nodo_{port}')))
     print(f"\n🚀 Nodo iniciado en puerto {port}")
+    print(f"⛏️  Workers de minado: {blockchain.mining_workers}")
     print(f"📡 Accede a: http://localhost:{port}/")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
@@ -102,15 +102,30 @@ def register_peers(nodes):
     
     print_success("Red P2P establecida")
 
+def wait_mining_job(url, job_id, max_seconds=60):
+    """Consulta /mine/status hasta que el trabajo de minado termina"""
+    deadline = time.time() + max_seconds
+    while time.time() < deadline:
+        response = requests.get(f"{url}/mine/status", params={'job': job_id}, timeout=5)
+        data = response.json()
+        if data.get('status') not in ('queued', 'mining'):
+            return data
+        time.sleep(0.2)
+    raise Exception(f"El trabajo de minado {job_id} no terminó en {max_seconds}s")
+
 def mine_blocks(url, name, count=1):
     """Mina bloques en un nodo"""
     for i in range(count):
         try:
             print_info(f"⛏️  {name} está minando bloque {i+1}/{count}...")
-            response = requests.post(f"{url}/mine", timeout=30)
+            response = requests.post(f"{url}/mine", timeout=5)
             
-            if response.status_code == 200:
-                data = response.json()
+            if response.status_code == 202:
+                # El nodo mina en segundo plano: esperar el resultado del trabajo
+                data = wait_mining_job(url, response.json()['job_id'])
+                if data.get('status') != 'done':
+                    print_error(f"Minado en {name} terminó como '{data.get('status')}': {data.get('error')}")
+                    return False
                 
                 block_index = data.get('block_index', '?')
                 reward = data.get('reward', 0)
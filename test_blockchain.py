@@ -0,0 +1,240 @@
+"""Pruebas automáticas del nodo de blockchain"""
+import pytest
+
+import blockchain as bc
+
+
+def signed_transaction(wallet, recipient, amount, fee=0):
+    """Transacción firmada por wallet"""
+    tx = bc.Transaction(wallet.get_address(), recipient, amount, wallet.get_public_key_pem(), fee)
+    tx.sign_transaction(wallet.sign_transaction(tx.to_dict()))
+    return tx
+
+
+def reward(chain, recipient='minero', amount=None):
+    """Recompensa de minado (por defecto la que corresponde a un bloque sin comisiones)"""
+    return bc.Transaction("MINING_REWARD", recipient, chain.mining_reward if amount is None else amount, "SYSTEM")
+
+
+def mine_on(chain, parent, transactions):
+    """Bloque minado sobre parent con la dificultad de la cadena"""
+    block = bc.Block(parent.index + 1, transactions, parent.hash)
+    block.mine_block(chain.difficulty)
+    return block
+
+
+def build_branch(chain, fork_height, reward_amounts):
+    """Rama alternativa desde el bloque fork_height, un bloque por cada monto de recompensa"""
+    parent = chain.chain[fork_height]
+    branch = []
+    for amount in reward_amounts:
+        parent = mine_on(chain, parent, [reward(chain, 'alternativa', amount)])
+        branch.append(parent)
+    return branch
+
+
+def chain_state(chain):
+    return [block.hash for block in chain.chain], dict(chain.balances), dict(chain.tx_index), len(chain.mempool)
+
+
+@pytest.fixture
+def wallet():
+    return bc.Wallet('prueba', 'ed25519')
+
+
+@pytest.fixture
+def funded(wallet):
+    """Cadena con un bloque cuya recompensa es para wallet"""
+    chain = bc.Blockchain()
+    chain.mine_pending_transactions(wallet.get_address())
+    return chain
+
+
+# ==================== MERKLE ====================
+def test_merkle_proof_links_each_transaction_to_the_root(funded, wallet):
+    for i in range(4):
+        funded.add_transaction(signed_transaction(wallet, f'destino{i}', 1))
+    funded.mine_pending_transactions('minero')
+    block = funded.chain[-1]
+
+    txids = block.get_txids()
+    for position, txid in enumerate(txids):
+        assert bc.verify_merkle_proof(txid, block.get_merkle_proof(position), block.merkle_root)
+    assert not bc.verify_merkle_proof(txids[0], block.get_merkle_proof(1), block.merkle_root)
+
+
+# ==================== FIRMAS Y MONTOS ====================
+def test_signature_must_be_lowercase_hex(wallet):
+    tx = signed_transaction(wallet, 'destino', 1)
+    variant = bc.Transaction.from_dict(dict(tx.to_signed_dict(), signature=tx.signature.upper()))
+
+    assert tx.is_valid()
+    assert variant.calculate_hash() != tx.calculate_hash()
+    assert not variant.is_valid()
+
+
+def test_ecdsa_signature_with_high_s_is_rejected():
+    wallet = bc.Wallet('prueba', 'ecdsa')
+    tx = signed_transaction(wallet, 'destino', 1)
+    r, s = bc.decode_dss_signature(bytes.fromhex(tx.signature))
+    malleated = bc.encode_dss_signature(r, bc.P256_ORDER - s).hex()
+    variant = bc.Transaction.from_dict(dict(tx.to_signed_dict(), signature=malleated))
+
+    assert tx.is_valid()
+    assert not variant.is_valid()
+
+
+def test_block_cannot_confirm_a_transaction_twice(funded, wallet):
+    tx = signed_transaction(wallet, 'destino', 1)
+    funded.add_transaction(tx)
+    funded.mine_pending_transactions('minero')
+    parent = funded.get_latest_block()
+    block = mine_on(funded, parent, [tx, reward(funded)])
+
+    assert funded.validate_block(block, parent).endswith("ya confirmada")
+
+
+@pytest.mark.parametrize('amount', [-5, 0, '1', float('nan'), float('inf'), True])
+def test_admission_rejects_invalid_amounts(funded, wallet, amount):
+    with pytest.raises(Exception, match='Monto inválido'):
+        funded.add_transaction(signed_transaction(wallet, 'destino', amount))
+
+
+def test_block_with_negative_amount_is_invalid(funded, wallet):
+    parent = funded.get_latest_block()
+    block = mine_on(funded, parent, [signed_transaction(wallet, 'destino', -5), reward(funded)])
+
+    assert funded.validate_block(block, parent) == f"Bloque {block.index}: monto inválido"
+
+
+@pytest.mark.parametrize('fee', [-1, '0.1', float('nan')])
+def test_admission_rejects_invalid_fees(funded, wallet, fee):
+    with pytest.raises(Exception, match='Comisión inválida'):
+        funded.add_transaction(signed_transaction(wallet, 'destino', 1, fee=fee))
+
+
+def test_admission_rejects_mining_rewards(funded):
+    with pytest.raises(Exception, match='recompensas de minado'):
+        funded.add_transaction(reward(funded, 'atacante', 1000))
+
+
+def test_block_reward_must_collect_the_fees(funded, wallet):
+    parent = funded.get_latest_block()
+    tx = signed_transaction(wallet, 'destino', 1, fee=0.5)
+    without_fees = mine_on(funded, parent, [tx, reward(funded)])
+    with_fees = mine_on(funded, parent, [tx, reward(funded, amount=funded.mining_reward + 0.5)])
+
+    assert funded.validate_block(without_fees, parent).endswith("recompensa de minado incorrecta")
+    assert funded.validate_block(with_fees, parent) is None
+
+
+# ==================== MEMPOOL ====================
+def test_full_mempool_evicts_the_cheapest_transaction(wallet):
+    chain = bc.Blockchain()
+    chain.mempool = bc.Mempool(max_size=3)
+    chain.mine_pending_transactions(wallet.get_address())
+    cheap = signed_transaction(wallet, 'destino', 1, fee=0.01)
+    for tx in [signed_transaction(wallet, 'destino', 1, fee=0.5), cheap, signed_transaction(wallet, 'destino', 1, fee=0.3)]:
+        chain.add_transaction(tx)
+
+    chain.add_transaction(signed_transaction(wallet, 'destino', 1, fee=0.2))
+
+    assert cheap.calculate_hash() not in chain.mempool
+    assert len(chain.mempool) == 3 and chain.mempool.evicted == 1
+    with pytest.raises(Exception, match='comisión es demasiado baja'):
+        chain.add_transaction(signed_transaction(wallet, 'destino', 1, fee=0.001))
+
+
+# ==================== FORMATO BINARIO ====================
+def test_wire_round_trip_keeps_blocks_and_txids(funded, wallet):
+    funded.add_transaction(signed_transaction(wallet, 'destino', 1.5, fee=0.25))
+    funded.add_transaction(signed_transaction(wallet, 'destino', 2))
+    funded.mine_pending_transactions('minero')
+    blocks = [block.to_dict() for block in funded.chain]
+    pending = signed_transaction(wallet, 'destino', 3).to_signed_dict()
+
+    meta, decoded_blocks, decoded_transactions = bc.decode_message(
+        bc.encode_message({'length': len(blocks)}, blocks=blocks, transactions=[pending])
+    )
+
+    assert meta == {'length': len(blocks)}
+    assert decoded_transactions == [pending]
+    for original, data in zip(funded.chain, decoded_blocks):
+        block = bc.Block.from_dict(data)
+        assert block.hash == block.calculate_hash() == original.hash
+        assert block.get_txids() == original.get_txids()
+
+
+def test_wire_encoder_rejects_non_canonical_signatures(wallet):
+    tx_data = signed_transaction(wallet, 'destino', 1).to_signed_dict()
+    tx_data['signature'] = tx_data['signature'].upper()
+
+    with pytest.raises(ValueError):
+        bc.encode_message({}, transactions=[tx_data])
+
+
+# ==================== REORGANIZACIÓN ====================
+def test_reorganize_switches_to_heavier_branch(funded, wallet):
+    funded.add_transaction(signed_transaction(wallet, 'destino', 1))
+    funded.mine_pending_transactions('minero')
+    funded.mine_pending_transactions('minero')
+    old_tip = funded.chain[2:]
+    branch = build_branch(funded, 1, [funded.mining_reward] * 3)
+
+    orphaned = funded.reorganize(1, branch)
+
+    assert orphaned == old_tip
+    assert [block.hash for block in funded.chain[2:]] == [block.hash for block in branch]
+    assert all(block.hash in funded.side_blocks for block in old_tip)
+    assert funded.verify_balances() == {}
+    # La transacción que la nueva rama no confirma vuelve al mempool
+    assert len(funded.mempool) == 1
+
+
+@pytest.mark.parametrize('keep_undo', [True, False])
+def test_reorganize_reverts_balances_exactly(funded, wallet, keep_undo):
+    for amount in (0.1, 0.2, 0.3):
+        funded.add_transaction(signed_transaction(wallet, 'destino', amount))
+        funded.mine_pending_transactions('minero')
+    if not keep_undo:
+        # Como tras un reinicio: los balances se recalculan desde la cadena
+        funded.balance_undo.clear()
+    branch = build_branch(funded, 1, [funded.mining_reward] * 4)
+
+    funded.reorganize(1, branch)
+
+    assert 'destino' not in funded.balances
+    assert funded.verify_balances() == {}
+
+
+def test_reorganize_restores_chain_when_a_block_is_invalid(funded):
+    funded.mine_pending_transactions('minero')
+    before = chain_state(funded)
+    branch = build_branch(funded, 1, [funded.mining_reward, 1000, funded.mining_reward])
+
+    with pytest.raises(Exception, match='recompensa de minado incorrecta'):
+        funded.reorganize(1, branch)
+
+    assert chain_state(funded) == before
+    assert branch[0].hash in funded.side_blocks
+    assert branch[1].hash not in funded.side_blocks and branch[2].hash not in funded.side_blocks
+
+
+def test_reorganize_restores_chain_when_validation_raises(funded, monkeypatch, tmp_path):
+    funded.attach_store(bc.BlockStore(str(tmp_path)))
+    funded.mine_pending_transactions('minero')
+    before = chain_state(funded)
+    branch = build_branch(funded, 1, [funded.mining_reward] * 3)
+
+    validate_block = funded.validate_block
+    def failing_validate_block(block, parent, check_signatures=True):
+        if block is branch[1]:
+            raise TypeError("fallo inesperado")
+        return validate_block(block, parent, check_signatures)
+    monkeypatch.setattr(funded, 'validate_block', failing_validate_block)
+
+    with pytest.raises(Exception, match='fallo inesperado'):
+        funded.reorganize(1, branch)
+
+    assert chain_state(funded) == before
+    assert [block.hash for block in funded.store.load_blocks()] == before[0]